@@ -0,0 +1,73 @@
+"""Import-time check for src/main.py using `python -X importtime`.
+
+Fails (exit code 1) when importing `main` takes longer than --max-ms or
+pulls in any of the heavy modules that should only load on first use.
+
+    python benchmarks/bench_import_time.py --max-ms 250 --runs 5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Modules that must stay out of a plain `import main`
+HEAVY_MODULES = ("langgraph", "langchain_core", "langchain_google_genai", "dotenv", "numpy")
+
+
+def measure(module):
+    """Return (cumulative microseconds for `module`, {imported module: self us})"""
+    env = dict(os.environ, PYTHONPATH=SRC_DIR)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env, capture_output=True, text=True, check=True
+    )
+    imported = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = [part.strip() for part in line[len("import time:"):].split("|")]
+        if not parts[0].isdigit():
+            continue  # header line
+        self_us, cumulative_us, name = int(parts[0]), int(parts[1]), parts[2]
+        imported[name.strip()] = self_us
+        if name.strip() == module:
+            total = cumulative_us
+    return total, imported
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=250.0)
+    parser.add_argument("--top", type=int, default=10, help="Show the slowest modules of the last run")
+    args = parser.parse_args()
+
+    timings = []
+    imported = {}
+    for _ in range(args.runs):
+        total, imported = measure(args.module)
+        timings.append(total / 1000)
+
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.1f} ms over {args.runs} runs (min {min(timings):.1f} ms)")
+    for name, self_us in sorted(imported.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    failures = []
+    heavy = sorted(name for name in imported if name.split(".")[0] in HEAVY_MODULES)
+    if heavy:
+        failures.append(f"heavy modules imported eagerly: {', '.join(heavy[:5])}")
+    if median > args.max_ms:
+        failures.append(f"median import time {median:.1f} ms exceeds {args.max_ms:.1f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
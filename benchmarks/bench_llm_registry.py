@@ -0,0 +1,80 @@
+"""Per-ticket latency with a client built per node call vs the shared registry.
+
+Runs entirely offline against fake_llm.FakeChatModel, which sleeps for
+`--setup-latency` when constructed (client + connection setup) and for
+`--call-latency` on every invoke.
+
+    python benchmarks/bench_llm_registry.py --tickets 20
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder")
+# Measure client reuse only; cached responses would hide the difference.
+os.environ.setdefault("LLM_CACHE", "off")
+
+import llm  # noqa: E402
+from fake_llm import fake_factory  # noqa: E402
+
+
+def run(process_ticket, tickets):
+    latencies = []
+    for i in range(tickets):
+        ticket = {"subject": f"App crash #{i}", "description": "The app crashes on startup"}
+        started = time.perf_counter()
+        # The nodes print their progress; keep benchmark output readable.
+        with contextlib.redirect_stdout(io.StringIO()):
+            process_ticket(ticket)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+
+def report(label, latencies):
+    print(
+        f"{label:<12} mean={statistics.mean(latencies) * 1000:8.1f} ms  "
+        f"p50={statistics.median(latencies) * 1000:8.1f} ms  "
+        f"max={max(latencies) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=20)
+    parser.add_argument("--setup-latency", type=float, default=0.05)
+    parser.add_argument("--call-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    import main as agent
+
+    # Build the graph and indexes up front so neither run absorbs the one-off startup cost
+    agent.warm_up()
+    factory = fake_factory(latency=args.call_latency, setup_latency=args.setup_latency)
+
+    # Before: every node call builds its own client, as the nodes used to.
+    original_get_model = llm.get_model
+    llm.get_model = lambda model=llm.DEFAULT_MODEL, temperature=0: factory(model, temperature)
+    try:
+        before = run(agent.process_ticket, args.tickets)
+    finally:
+        llm.get_model = original_get_model
+
+    # After: clients come from the shared registry.
+    llm.set_model_factory(factory)
+    after = run(agent.process_ticket, args.tickets)
+    llm.set_model_factory(None)
+
+    report("per-call", before)
+    report("registry", after)
+    print(f"speedup: {statistics.mean(before) / statistics.mean(after):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
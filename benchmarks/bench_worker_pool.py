@@ -0,0 +1,84 @@
+"""Worker-pool scaling benchmark against the fake LLM.
+
+Enqueues the same synthetic corpus into a fresh SQLite queue for each worker
+count and reports tickets/sec and the speedup over one worker. Every worker
+process installs a FakeChatModel, so no API key or network access is needed.
+
+    python benchmarks/bench_worker_pool.py --tickets 200 --workers 1,2,4,8
+"""
+import argparse
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+SYNTHETIC_TICKETS = [
+    ("Forgot password", "I can't log in and the reset email never arrives."),
+    ("Refund request", "I was charged twice for my subscription this month."),
+    ("App crashes", "The mobile app crashes every time I open settings."),
+    ("Account hacked", "Someone changed my email address without permission."),
+]
+
+
+def install_fake_model(latency, approve_rate):
+    """Worker initializer: quiet logging and a shared fake model"""
+    import llm
+    from fake_llm import FakeChatModel, ScriptedResponder, parse_latency
+
+    logging.disable(logging.WARNING)
+    sys.stdout = open(os.devnull, "w")
+    model = FakeChatModel(latency=parse_latency(latency), responder=ScriptedResponder(approve_rate=approve_rate))
+    llm.set_model_factory(lambda name, temperature: model)
+
+
+def run(workers, tickets, args):
+    from work_queue import WorkQueue
+    from worker_pool import run_pool
+
+    path = os.path.join(tempfile.mkdtemp(), "queue.sqlite")
+    work_queue = WorkQueue(path)
+    work_queue.enqueue_many(tickets)
+    work_queue.close()
+
+    started = time.perf_counter()
+    stats = run_pool(
+        path,
+        workers=workers,
+        poll_interval=0.05,
+        initializer=install_fake_model,
+        initargs=(args.latency, args.approve_rate)
+    )
+    return time.perf_counter() - started, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickets", type=int, default=200)
+    parser.add_argument("--workers", default="1,2,4")
+    parser.add_argument("--latency", default="0.02", help="Per-call latency distribution (see fake_llm)")
+    parser.add_argument("--approve-rate", type=float, default=0.8)
+    args = parser.parse_args()
+
+    os.environ.setdefault("LLM_CACHE", "off")
+    os.environ.setdefault("ESCALATION_PATH", os.path.join(tempfile.mkdtemp(), "escalations.sqlite"))
+    tickets = [
+        {"id": f"synthetic-{i}", "subject": subject, "description": f"{description} (#{i})"}
+        for i, (subject, description) in zip(range(args.tickets), itertools.cycle(SYNTHETIC_TICKETS))
+    ]
+
+    baseline = None
+    print(f"{'workers':>8}{'seconds':>10}{'tix/s':>9}{'speedup':>9}{'done':>7}{'dead':>6}")
+    for workers in (int(value) for value in args.workers.split(",")):
+        elapsed, stats = run(workers, tickets, args)
+        rate = len(tickets) / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>8}{elapsed:>10.2f}{rate:>9.1f}{rate / baseline:>9.2f}{stats['done']:>7}{stats['dead']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Equivalence check for incremental knowledge base updates.
+
+Applies random add/insert/move/change/remove edits to a synthetic knowledge base and,
+after each one, checks that KnowledgeBaseIndex.apply() gives the same
+version, documents and search results as a full rebuild, and that the
+previous index was left untouched. Fails (exit code 1) on the first
+mismatch.
+
+    python benchmarks/check_kb_incremental.py --edits 500 --seed 7
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+from knowledge_base import KnowledgeBaseIndex  # noqa: E402
+
+CATEGORIES = ("technical", "billing", "security", "general")
+VOCABULARY = (
+    "password reset email login account charge refund invoice subscription crash app "
+    "settings update error device token session browser cache payment card plan upgrade"
+).split()
+
+
+def random_doc(rng, doc_id):
+    words = lambda n: " ".join(rng.choice(VOCABULARY) for _ in range(n))
+    doc = {
+        "title": f"Doc {doc_id}",
+        "content": words(rng.randint(3, 30)),
+        "keywords": [rng.choice(VOCABULARY) for _ in range(rng.randint(0, 3))],
+    }
+    # Mix documents keyed by id with documents keyed by (possibly repeated) title
+    if rng.random() < 0.7:
+        doc["id"] = f"doc-{doc_id}"
+    elif rng.random() < 0.3:
+        doc["title"] = "Shared title"
+    return doc
+
+
+def random_edit(rng, knowledge_base, next_id):
+    """Mutate `knowledge_base` in place; returns the next free doc id"""
+    category = rng.choice(CATEGORIES + ("new-category",))
+    docs = knowledge_base.setdefault(category, [])
+    action = rng.choice(("add", "add", "insert", "move", "change", "remove", "drop-category")) if docs else "add"
+    if action == "add":
+        for _ in range(rng.randint(1, 3)):
+            docs.append(random_doc(rng, next_id))
+            next_id += 1
+    elif action == "insert":
+        docs.insert(rng.randrange(len(docs)), random_doc(rng, next_id))
+        next_id += 1
+    elif action == "move":
+        docs.insert(rng.randrange(len(docs)), docs.pop(rng.randrange(len(docs))))
+    elif action == "change":
+        doc = rng.choice(docs)
+        doc["content"] = " ".join(rng.choice(VOCABULARY) for _ in range(rng.randint(3, 30)))
+    elif action == "remove":
+        del docs[rng.randrange(len(docs))]
+    elif rng.random() < 0.2:
+        del knowledge_base[category]
+    return next_id
+
+
+def snapshot(index, queries):
+    """Everything observable about an index, copied so later mutation shows up"""
+    return {
+        "version": index.version,
+        "categories": {
+            name: {
+                "documents": copy.deepcopy(category.documents()),
+                "fingerprints": dict(category.fingerprints),
+                "postings": {term: dict(postings) for term, postings in category.postings.items()},
+                "doc_lengths": list(category.doc_lengths),
+                "total_length": category.total_length,
+            }
+            for name, category in index.categories.items()
+        },
+        "results": search_results(index, queries),
+    }
+
+
+def search_results(index, queries):
+    return [
+        copy.deepcopy(index.search(category, query, k=3))
+        for category in index.categories
+        for query in queries
+    ]
+
+
+def check(edits, seed, queries_per_edit):
+    rng = random.Random(seed)
+    knowledge_base = {category: [random_doc(rng, i * 10 + j) for j in range(5)] for i, category in enumerate(CATEGORIES)}
+    next_id = 1000
+    index = KnowledgeBaseIndex(knowledge_base)
+    totals = {"added": 0, "changed": 0, "removed": 0}
+
+    for edit in range(1, edits + 1):
+        next_id = random_edit(rng, knowledge_base, next_id)
+        # Each reload hands over freshly parsed documents, never the previous objects
+        reloaded = copy.deepcopy(knowledge_base)
+        queries = [" ".join(rng.sample(VOCABULARY, rng.randint(1, 4))) for _ in range(queries_per_edit)]
+        queries.append("nothing matches this")
+
+        before = snapshot(index, queries)
+        updated, changes = index.apply(reloaded)
+        full = KnowledgeBaseIndex(copy.deepcopy(knowledge_base))
+
+        if snapshot(index, queries) != before:
+            return f"edit {edit}: apply() mutated the previous index (version {index.version})"
+        if updated.version != full.version:
+            return f"edit {edit}: version {updated.version} != full rebuild {full.version}"
+        for name, category in full.categories.items():
+            if updated.categories[name].documents() != category.documents():
+                return f"edit {edit}: documents of {name!r} differ from the full rebuild"
+        if search_results(updated, queries) != search_results(full, queries):
+            return f"edit {edit}: search results differ from the full rebuild"
+        if (changes["added"] or changes["changed"] or changes["removed"]) and updated.version == index.version:
+            return f"edit {edit}: {changes} reported but the version did not change"
+
+        for name in totals:
+            totals[name] += changes[name]
+        index = updated
+
+    print(
+        f"{edits} edits OK (seed {seed}): {totals['added']} added, {totals['changed']} changed, "
+        f"{totals['removed']} removed; final version {index.version}"
+    )
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--edits", type=int, default=200, help="random edits to apply")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--queries", type=int, default=5, help="random queries checked per category and edit")
+    args = parser.parse_args()
+
+    error = check(args.edits, args.seed, args.queries)
+    if error:
+        print(f"FAIL: {error}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""Offline throughput benchmark for the compiled support graph.
+
+Drives `app` with a fake model (configurable latency distributions and
+scripted review outcomes) over a replay corpus or synthetic tickets, and
+reports tickets/sec, p50/p95/p99 per node, retry and escalation rates and
+peak RSS. No network access or API key is needed, so it can run in CI.
+
+    python benchmarks/harness.py --synthetic 200 --modes sequential,threaded,async
+    python benchmarks/harness.py --corpus tickets.jsonl --latency lognormal:0.2:0.4 --approve-rate 0.7
+
+When several modes are requested each one runs in its own subprocess so
+peak RSS is measured per mode.
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+
+MODES = ("sequential", "threaded", "async")
+NODES = ("classify", "retrieve", "draft", "compose", "review", "escalate")
+
+SYNTHETIC_TICKETS = [
+    ("Forgot password", "I can't log in and the reset email never arrives."),
+    ("Refund request", "I was charged twice for my subscription this month."),
+    ("App crashes", "The mobile app crashes every time I open settings."),
+    ("Invoice download", "Where can I download PDF invoices for last year?"),
+    ("Account hacked", "Someone changed my email address without permission."),
+    ("Feature idea", "Please add a dark mode to the dashboard."),
+    ("VPN blocks app", "The app cannot connect while I'm on the company VPN."),
+    ("Update data", "How do I change the phone number on my profile?"),
+]
+
+
+def load_tickets(args):
+    if args.corpus:
+        from batch import iter_tickets
+
+        with open(args.corpus, "r", encoding="utf-8") as file:
+            return [ticket for _, ticket, error in iter_tickets(file) if ticket is not None]
+    templates = itertools.cycle(SYNTHETIC_TICKETS)
+    return [
+        {"id": f"synthetic-{i}", "subject": subject, "description": f"{description} (#{i})"}
+        for i, (subject, description) in zip(range(args.synthetic), templates)
+    ]
+
+
+def build_model(args):
+    from fake_llm import FakeChatModel, ScriptedResponder, parse_latency
+
+    latency = {
+        kind: parse_latency(getattr(args, f"{kind}_latency") or args.latency, seed=args.seed + offset)
+        for offset, kind in enumerate(("classify", "draft", "review"))
+    }
+    # The combined draft + self-review call generates a draft too
+    latency["compose"] = latency["draft"]
+    latency["classify_batch"] = latency["classify"]
+    responder = ScriptedResponder(
+        review_outcomes=args.review_outcomes.split(",") if args.review_outcomes else None,
+        approve_rate=args.approve_rate,
+        seed=args.seed
+    )
+    return FakeChatModel(latency=latency, responder=responder)
+
+# ------------------------------------------------
+# Execution modes
+# ------------------------------------------------
+def run_sequential(agent, tickets, config, concurrency):
+    for ticket in tickets:
+        agent.process_ticket(ticket, config=config)
+
+
+def run_threaded(agent, tickets, config, concurrency):
+    from functools import partial
+    from batch import run_batch
+
+    corpus = io.StringIO("".join(json.dumps(ticket) + "\n" for ticket in tickets))
+    run_batch(partial(agent.process_ticket, config=config), corpus, io.StringIO(), concurrency=concurrency)
+
+
+def run_async(agent, tickets, config, concurrency):
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(ticket):
+            async with semaphore:
+                await agent.aprocess_ticket(ticket, config=config)
+
+        await asyncio.gather(*(one(ticket) for ticket in tickets))
+
+    asyncio.run(main())
+
+
+RUNNERS = {"sequential": run_sequential, "threaded": run_threaded, "async": run_async}
+
+
+def run_mode(mode, args):
+    import llm
+    import metrics
+
+    os.environ.setdefault("LLM_CACHE", "on" if args.cache else "off")
+    os.environ.setdefault("ESCALATION_PATH", os.path.join(tempfile.mkdtemp(), "escalations.csv"))
+    logging.disable(logging.WARNING)
+
+    import main as agent
+
+    metrics.enable()
+    metrics.REGISTRY.reset()
+    for histogram in (metrics.NODE_LATENCY, metrics.LLM_LATENCY):
+        histogram.keep_samples()
+
+    tickets = load_tickets(args)
+    model = build_model(args)
+    llm.set_model_factory(lambda name, temperature: model)
+    configurable = {}
+    if not args.fast_path:
+        configurable["fast_path_threshold"] = 2.0
+    if args.combined:
+        configurable["draft_modes"] = {category.strip(): "combined" for category in args.combined.split(",")}
+    if args.classify_batch:
+        from classify_batcher import ClassificationBatcher
+
+        configurable["classify_batcher"] = ClassificationBatcher(window=args.classify_batch / 1000)
+    config = {"configurable": configurable}
+    # Graph compilation and index builds are one-off startup costs, not per-ticket work
+    agent.warm_up(config)
+
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        RUNNERS[mode](agent, tickets, config, args.concurrency)
+    elapsed = time.perf_counter() - started
+    agent.close_escalation_writer()
+    if args.classify_batch:
+        configurable["classify_batcher"].close()
+
+    summary = metrics.summary()
+    report = {
+        "mode": mode,
+        "tickets": len(tickets),
+        "concurrency": 1 if mode == "sequential" else args.concurrency,
+        "seconds": round(elapsed, 3),
+        "tickets_per_second": round(len(tickets) / elapsed, 2) if elapsed else 0.0,
+        "llm_calls": model.calls,
+        "retry_rate": round(summary["retries"] / len(tickets), 4) if tickets else 0.0,
+        "escalation_rate": summary["escalation_rate"],
+        "fast_path_share": summary["fast_path_share"],
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "draft_modes": summary["draft_modes"],
+        "classify_batches": summary["classify_batches"],
+        "nodes": {},
+    }
+    for node in NODES + ("llm",):
+        histogram = metrics.LLM_LATENCY if node == "llm" else metrics.NODE_LATENCY
+        labels = {} if node == "llm" else {"node": node}
+        if histogram.quantile(0.5, **labels) or node == "llm":
+            report["nodes"][node] = {
+                f"p{int(q * 100)}_ms": round(histogram.quantile(q, **labels) * 1000, 2) for q in (0.5, 0.95, 0.99)
+            }
+    return report
+
+# ------------------------------------------------
+# Reporting
+# ------------------------------------------------
+def print_report(reports):
+    print(f"{'mode':<11}{'tickets':>8}{'conc':>6}{'tix/s':>9}{'llm':>7}{'retry':>8}{'escal':>8}{'rss MB':>9}")
+    for report in reports:
+        print(
+            f"{report['mode']:<11}{report['tickets']:>8}{report['concurrency']:>6}"
+            f"{report['tickets_per_second']:>9}{report['llm_calls']:>7}{report['retry_rate']:>8}"
+            f"{report['escalation_rate']:>8}{report['peak_rss_mb']:>9}"
+        )
+    for report in reports:
+        for draft_mode, stats in report.get("draft_modes", {}).items():
+            print(f"\n[{report['mode']}] {draft_mode} drafting: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        if report.get("classify_batches"):
+            stats = report["classify_batches"]
+            print(f"\n[{report['mode']}] classify batching: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        print(f"\n[{report['mode']}] latency per node (ms)")
+        for node, quantiles in report["nodes"].items():
+            print(f"  {node:<10}" + "".join(f"{name}={value:>9}  " for name, value in quantiles.items()))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--corpus", help="JSONL tickets to replay (same format as --batch)")
+    source.add_argument("--synthetic", type=int, default=200, help="Number of synthetic tickets")
+    parser.add_argument("--modes", default="sequential,threaded,async")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", default="lognormal:0.05:0.4", help="Per-call latency distribution")
+    parser.add_argument("--classify-latency")
+    parser.add_argument("--draft-latency")
+    parser.add_argument("--review-latency")
+    parser.add_argument("--approve-rate", type=float, default=0.8)
+    parser.add_argument("--review-outcomes", help="Outcome per attempt, e.g. rejected,approved")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", action="store_true", help="Enable the LLM response cache")
+    parser.add_argument("--no-fast-path", dest="fast_path", action="store_false",
+                        help="Always classify with the (fake) LLM")
+    parser.add_argument("--combined", metavar="CATEGORIES",
+                        help="Categories (or *) that use the combined draft + self-review call")
+    parser.add_argument("--classify-batch", metavar="MS", type=float, default=0,
+                        help="Micro-batch LLM classification with this window (use with --no-fast-path)")
+    parser.add_argument("--json", metavar="PATH", help="Also write the reports as JSON")
+    parser.add_argument("--single", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        sys.exit(f"Unknown mode(s): {', '.join(sorted(unknown))}")
+
+    if args.single or len(modes) == 1:
+        reports = [run_mode(mode, args) for mode in modes]
+    else:
+        reports = []
+        for mode in modes:
+            argv = [arg for arg in sys.argv[1:]]
+            argv += ["--modes", mode, "--single", "--json", "-"]
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__)] + argv,
+                check=True, capture_output=True, text=True
+            ).stdout
+            reports.extend(json.loads(output.strip().splitlines()[-1]))
+
+    if args.json == "-":
+        print(json.dumps(reports))
+        return
+    print_report(reports)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(reports, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------
+# Ticket parsing
+# ------------------------------------------------
+def parse_ticket(line, line_number):
+    """Turn one JSONL line into a ticket dict, or None for blank lines"""
+    line = line.strip()
+    if not line:
+        return None
+
+    record = json.loads(line)
+    # Accept either {"ticket": {...}} or a flat record. title/body are
+    # accepted as aliases so request-style exports can be replayed as-is.
+    source = record.get("ticket", record)
+    ticket_id = (
+        record.get("id")
+        or record.get("ticket_id")
+        or record.get("request_id")
+        or f"line-{line_number}"
+    )
+    return {
+        "id": str(ticket_id),
+        "subject": source.get("subject") or source.get("title", ""),
+        "description": source.get("description") or source.get("body", ""),
+    }
+
+
+def iter_tickets(stream):
+    """Lazily yield (line_number, ticket, error) tuples from a JSONL stream"""
+    for line_number, line in enumerate(stream, start=1):
+        try:
+            ticket = parse_ticket(line, line_number)
+        except (json.JSONDecodeError, AttributeError) as e:
+            yield line_number, None, f"invalid ticket JSON: {e}"
+            continue
+        if ticket is not None:
+            yield line_number, ticket, None
+
+# ------------------------------------------------
+# Result serialization
+# ------------------------------------------------
+def summarize_result(ticket, result, elapsed):
+    return {
+        "id": ticket["id"],
+        "subject": ticket["subject"],
+        "category": result.get("category", ""),
+        "review_status": result.get("review_status", ""),
+        "attempts": result.get("attempt", 0),
+        "draft": result.get("draft", ""),
+        "doc_titles": result.get("doc_titles", []),
+        "kb_version": result.get("kb_version", ""),
+        "escalated": bool(result.get("escalation_status")),
+        "prompt_tokens_saved": result.get("prompt_tokens_saved", 0),
+        "elapsed_seconds": round(elapsed, 3),
+    }
+
+
+def _run_one(process_ticket, ticket):
+    started = time.perf_counter()
+    try:
+        result = process_ticket(ticket)
+    except Exception as e:
+        logger.error(f"Ticket {ticket['id']} failed: {e}", exc_info=True)
+        return {
+            "id": ticket["id"],
+            "subject": ticket["subject"],
+            "error": str(e),
+            "elapsed_seconds": round(time.perf_counter() - started, 3),
+        }
+    return summarize_result(ticket, result, time.perf_counter() - started)
+
+# ------------------------------------------------
+# Batch runner
+# ------------------------------------------------
+def run_batch(process_ticket, input_stream, output_stream, concurrency=4, flush_every=100):
+    """Stream tickets through process_ticket with at most `concurrency` in flight.
+
+    Results are written as JSONL in completion order. Input is consumed
+    lazily and a new ticket is only read once a slot frees up, so memory
+    stays bounded by the concurrency level regardless of input size.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+
+    stats = {"processed": 0, "failed": 0, "invalid": 0}
+    tickets = iter_tickets(input_stream)
+    pending = set()
+    written = 0
+
+    def write(record):
+        nonlocal written
+        output_stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        written += 1
+        if written % flush_every == 0:
+            output_stream.flush()
+
+    def fill(executor):
+        while len(pending) < concurrency:
+            item = next(tickets, None)
+            if item is None:
+                return False
+            line_number, ticket, error = item
+            if error:
+                stats["invalid"] += 1
+                write({"id": f"line-{line_number}", "error": error})
+                continue
+            pending.add(executor.submit(_run_one, process_ticket, ticket))
+        return True
+
+    logger.info(f"Starting batch run with concurrency={concurrency}")
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ticket") as executor:
+        has_more = fill(executor)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                record = future.result()
+                stats["failed" if "error" in record else "processed"] += 1
+                write(record)
+            if has_more:
+                has_more = fill(executor)
+
+    output_stream.flush()
+    logger.info(
+        f"Batch run finished: {stats['processed']} processed, "
+        f"{stats['failed']} failed, {stats['invalid']} invalid"
+    )
+    return stats
+
+
+def open_input(path):
+    if path == "-":
+        return sys.stdin
+    return open(path, "r", encoding="utf-8")
+
+
+def open_output(path):
+    if path == "-":
+        return sys.stdout
+    return open(path, "w", encoding="utf-8")
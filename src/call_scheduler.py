@@ -0,0 +1,373 @@
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class CallTimeoutError(TimeoutError):
+    """An LLM call did not finish (or get a slot) before its deadline"""
+
+
+_END = object()
+
+# ------------------------------------------------
+# Error classification
+# ------------------------------------------------
+def error_status(exc):
+    """HTTP-style status carried by a provider error, if any"""
+    for attribute in ("status_code", "code"):
+        value = getattr(exc, attribute, None)
+        if isinstance(value, int):
+            return int(value)
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_throttled(exc):
+    if error_status(exc) == 429:
+        return True
+    text = f"{type(exc).__name__} {exc}"
+    return any(marker in text for marker in ("ResourceExhausted", "RESOURCE_EXHAUSTED", "TooManyRequests"))
+
+
+def is_retryable(exc):
+    """Throttles, timeouts, connection drops and 5xx are worth another try"""
+    if is_throttled(exc) or isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    status = error_status(exc)
+    if status is not None:
+        return status >= 500 or status == 408
+    return type(exc).__name__ in ("ServiceUnavailable", "DeadlineExceeded", "InternalServerError")
+
+# ------------------------------------------------
+# Rate and concurrency limits
+# ------------------------------------------------
+class TokenBucket:
+    """Requests-per-second limit with bursts of up to `burst` calls"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _take(self):
+        """Take a token if one is available; otherwise return the seconds until one is"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    def try_acquire(self):
+        with self._lock:
+            return self._take() == 0.0
+
+    def acquire(self, deadline=None):
+        """Block until a token is available; False if that would pass `deadline`"""
+        while True:
+            with self._lock:
+                delay = self._take()
+            if delay == 0.0:
+                return True
+            if deadline is not None and time.monotonic() + delay > deadline:
+                return False
+            time.sleep(delay)
+
+
+class AIMDLimiter:
+    """Concurrency limit with additive increase / multiplicative decrease.
+
+    Each successful call grows the limit by 1/limit, so about +1 per full
+    window of calls. A throttle, timeout or call slower than
+    `latency_target` multiplies it by `backoff`, at most once per `cooldown`
+    seconds so a burst of 429s from one overload counts once.
+    """
+
+    def __init__(self, initial=8, min_limit=1, max_limit=64, backoff=0.5, latency_target=None, cooldown=1.0):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._last_decrease = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self, deadline=None):
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, overloaded=False):
+        with self._condition:
+            self.in_flight -= 1
+            slow = self.latency_target is not None and latency is not None and latency > self.latency_target
+            if overloaded or slow:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif latency is not None:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+# ------------------------------------------------
+# Scheduler
+# ------------------------------------------------
+class CallScheduler:
+    """Runs model calls under a rate limit, an adaptive concurrency limit,
+    per-attempt timeouts, an overall deadline and jittered retries.
+
+    With `hedge_after` set, an attempt still running after that many seconds
+    gets a duplicate request (only if the rate limit has a spare token) and
+    the first successful answer wins. Attempts that time out are abandoned
+    rather than interrupted, so their worker threads finish in the background.
+    """
+
+    def __init__(self, rate=0.0, burst=None, concurrency=8, min_concurrency=1, max_concurrency=64,
+                 latency_target=None, timeout=None, deadline=None, max_retries=3,
+                 backoff_base=0.5, backoff_max=20.0, hedge_after=None, name="llm"):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.limiter = AIMDLimiter(concurrency, min_concurrency, max_concurrency, latency_target=latency_target)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self._max_workers = 2 * max_concurrency
+        self._executor = None
+        self._lock = threading.Lock()
+        self._counts = {"calls": 0, "retries": 0, "throttled": 0, "timeouts": 0, "hedges": 0, "hedge_wins": 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._counts[name] += 1
+
+    def _submit(self, fn):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._max_workers, thread_name_prefix=f"{self.name}-call")
+        return self._executor.submit(fn)
+
+    def _attempt(self, fn, attempt_deadline):
+        if attempt_deadline is None and self.hedge_after is None:
+            return fn()
+
+        primary = self._submit(fn)
+        futures = {primary}
+        if self.hedge_after is not None:
+            wait(futures, timeout=self.hedge_after)
+            still_running = not primary.done()
+            time_left = attempt_deadline is None or time.monotonic() < attempt_deadline
+            if still_running and time_left and (self.bucket is None or self.bucket.try_acquire()):
+                futures.add(self._submit(fn))
+                self._count("hedges")
+                if metrics.enabled():
+                    metrics.LLM_HEDGES.inc(outcome="launched")
+
+        while futures:
+            remaining = None if attempt_deadline is None else max(0.0, attempt_deadline - time.monotonic())
+            done, futures = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+            if not done:
+                for future in futures:
+                    future.cancel()
+                raise CallTimeoutError(f"LLM call timed out after {self.timeout}s")
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                        if metrics.enabled():
+                            metrics.LLM_HEDGES.inc(outcome="won")
+                    return future.result()
+            error = next(iter(done)).exception()
+        # Every copy failed; surface the last error
+        raise error
+
+    def _acquire(self, deadline):
+        """Wait for a rate token and a concurrency slot; returns when the attempt starts"""
+        waiting_since = time.monotonic()
+        if self.bucket is not None and not self.bucket.acquire(deadline):
+            raise CallTimeoutError("LLM call deadline passed while waiting for the rate limit")
+        if not self.limiter.acquire(deadline):
+            raise CallTimeoutError("LLM call deadline passed while waiting for a concurrency slot")
+        started = time.monotonic()
+        if metrics.enabled():
+            metrics.LLM_QUEUE_WAIT.observe(started - waiting_since)
+        return started
+
+    def _attempt_deadline(self, started, deadline):
+        attempt_deadline = started + self.timeout if self.timeout else None
+        if deadline is not None:
+            attempt_deadline = min(attempt_deadline or deadline, deadline)
+        return attempt_deadline
+
+    def _failed(self, error, attempt, deadline):
+        """Release the slot of a failed attempt; True after backing off if it should be retried"""
+        throttled = is_throttled(error)
+        timed_out = isinstance(error, TimeoutError)
+        self.limiter.release(overloaded=throttled or timed_out)
+        reason = "throttled" if throttled else "timeout" if timed_out else "error"
+        if throttled or timed_out:
+            self._count("throttled" if throttled else "timeouts")
+        if attempt == self.max_retries or not is_retryable(error):
+            return False
+        # Full jitter keeps retries from many threads from arriving in lockstep
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return False
+        self._count("retries")
+        if metrics.enabled():
+            metrics.LLM_RETRY_ATTEMPTS.inc(reason=reason)
+        logger.warning(
+            f"LLM call failed ({reason}: {error}); retry {attempt + 1}/{self.max_retries} in {delay:.2f}s"
+        )
+        time.sleep(delay)
+        return True
+
+    def run(self, fn):
+        """Call `fn()` under the limits and return its result, retrying transient failures"""
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        for attempt in range(self.max_retries + 1):
+            started = self._acquire(deadline)
+            try:
+                result = self._attempt(fn, self._attempt_deadline(started, deadline))
+            except Exception as e:
+                if self._failed(e, attempt, deadline):
+                    continue
+                raise
+            self.limiter.release(latency=time.monotonic() - started)
+            return result
+
+    def _next_chunk(self, chunks, attempt_deadline):
+        if attempt_deadline is None:
+            return next(chunks, _END)
+        future = self._submit(lambda: next(chunks, _END))
+        done, _ = wait({future}, timeout=max(0.0, attempt_deadline - time.monotonic()))
+        if not done:
+            raise CallTimeoutError(f"LLM stream timed out after {self.timeout}s")
+        return future.result()
+
+    def stream(self, open_stream):
+        """Yield the chunks of `open_stream()` under the limits.
+
+        A failure before the first chunk is retried like run(). Chunks already
+        handed to the caller cannot be taken back, so a failure after that is
+        raised. The per-attempt timeout and the deadline cover the whole
+        stream; a timed-out stream is abandoned like a timed-out call.
+        There is no hedging.
+        """
+        self._count("calls")
+        deadline = time.monotonic() + self.deadline if self.deadline else None
+        for attempt in range(self.max_retries + 1):
+            started = self._acquire(deadline)
+            attempt_deadline = self._attempt_deadline(started, deadline)
+            chunks = None
+            streamed = abandoned = False
+            try:
+                chunks = iter(open_stream())
+                while True:
+                    chunk = self._next_chunk(chunks, attempt_deadline)
+                    if chunk is _END:
+                        break
+                    streamed = True
+                    yield chunk
+            except Exception as e:
+                # A chunk still being fetched in the background cannot be closed
+                abandoned = isinstance(e, CallTimeoutError)
+                # Only a stream that has not yielded anything yet can be retried
+                if self._failed(e, self.max_retries if streamed else attempt, deadline):
+                    continue
+                raise
+            except BaseException:
+                # The consumer stopped reading (e.g. an aborted draft)
+                self.limiter.release()
+                raise
+            finally:
+                if chunks is not None and not abandoned and hasattr(chunks, "close"):
+                    chunks.close()
+            self.limiter.release(latency=time.monotonic() - started)
+            return
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        counts["concurrency_limit"] = round(self.limiter.limit, 2)
+        counts["in_flight"] = self.limiter.in_flight
+        return counts
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+# ------------------------------------------------
+# Per-model schedulers
+# ------------------------------------------------
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+
+def _env_float(name, default=None):
+    value = os.getenv(name, "").strip()
+    return float(value) if value else default
+
+
+def scheduler_enabled():
+    return os.getenv("LLM_SCHEDULER", "on").strip().lower() not in ("0", "off", "false", "no")
+
+
+def get_scheduler(model):
+    """Process-wide scheduler for `model`, or None when LLM_SCHEDULER=off.
+
+    LLM_RATE_LIMIT (requests/sec, 0 = unlimited) and LLM_RATE_BURST set the
+    token bucket; LLM_CONCURRENCY / LLM_MAX_CONCURRENCY the AIMD limit;
+    LLM_LATENCY_TARGET the latency that counts as overload; LLM_TIMEOUT the
+    per-attempt timeout, LLM_DEADLINE the budget across retries;
+    LLM_MAX_RETRIES the retry count; LLM_HEDGE_AFTER enables hedging.
+    """
+    if not scheduler_enabled():
+        return None
+    scheduler = _schedulers.get(model)
+    if scheduler is None:
+        with _schedulers_lock:
+            scheduler = _schedulers.get(model)
+            if scheduler is None:
+                scheduler = CallScheduler(
+                    rate=_env_float("LLM_RATE_LIMIT", 0.0),
+                    burst=_env_float("LLM_RATE_BURST"),
+                    concurrency=int(_env_float("LLM_CONCURRENCY", 8)),
+                    max_concurrency=int(_env_float("LLM_MAX_CONCURRENCY", 64)),
+                    latency_target=_env_float("LLM_LATENCY_TARGET"),
+                    timeout=_env_float("LLM_TIMEOUT", 60.0),
+                    deadline=_env_float("LLM_DEADLINE"),
+                    max_retries=int(_env_float("LLM_MAX_RETRIES", 3)),
+                    hedge_after=_env_float("LLM_HEDGE_AFTER"),
+                    name=model
+                )
+                _schedulers[model] = scheduler
+    return scheduler
+
+
+def all_scheduler_stats():
+    with _schedulers_lock:
+        return {model: scheduler.stats() for model, scheduler in _schedulers.items()}
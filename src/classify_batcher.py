@@ -0,0 +1,207 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import metrics
+from llm import invoke_model, response_cache_slot
+from parsing import CATEGORIES, CATEGORY_SCHEMA, BATCH_CATEGORY_SCHEMA, parse_category, parse_categories
+from prompts import build_classify_prompt, build_batch_classify_prompt
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+# ------------------------------------------------
+# Single and multi-ticket classification calls
+# ------------------------------------------------
+def classify_one(ticket, config=None):
+    return parse_category(invoke_model(build_classify_prompt(ticket, CATEGORIES), config, schema=CATEGORY_SCHEMA))
+
+
+def _uncached(config):
+    """`config` with the response cache bypassed, for calls whose answers are cached per ticket"""
+    config = config or {}
+    return {**config, "configurable": {**config.get("configurable", {}), "cache": None}}
+
+
+def classify_many(tickets, config=None):
+    """Classify several tickets with one structured call.
+
+    Each ticket is first looked up under the cache key of its single-ticket
+    classification, and only the misses are sent; their answers are stored
+    under those keys, so batched and unbatched runs share cache entries.
+    Tickets the answer leaves out (or labels invalidly) are classified on
+    their own, so every ticket gets a category.
+    """
+    if len(tickets) == 1:
+        return [classify_one(tickets[0], config)]
+
+    categories = [None] * len(tickets)
+    slots = []
+    for index, ticket in enumerate(tickets):
+        cache, key = response_cache_slot(build_classify_prompt(ticket, CATEGORIES), config, schema=CATEGORY_SCHEMA)
+        text = cache.get(key) if cache is not None else None
+        if cache is not None and metrics.enabled():
+            metrics.LLM_CACHE_LOOKUPS.inc(result="miss" if text is None else "hit")
+        if text is not None:
+            categories[index] = parse_category(text)
+        slots.append((cache, key))
+    misses = [index for index, category in enumerate(categories) if category is None]
+    if not misses:
+        return categories
+
+    uncached = _uncached(config)
+    if len(misses) == 1:
+        categories[misses[0]] = classify_one(tickets[misses[0]], uncached)
+    else:
+        prompt = build_batch_classify_prompt([tickets[index] for index in misses], CATEGORIES)
+        answers = parse_categories(invoke_model(prompt, uncached, schema=BATCH_CATEGORY_SCHEMA), len(misses))
+        missing = [index for index, category in zip(misses, answers) if category is None]
+        if missing:
+            logger.warning(
+                f"Batched classification missed {len(missing)} of {len(misses)} tickets; classifying them singly"
+            )
+        for index, category in zip(misses, answers):
+            categories[index] = category or classify_one(tickets[index], uncached)
+
+    for index in misses:
+        cache, key = slots[index]
+        if cache is not None:
+            # The answer the single-ticket structured call would have cached
+            cache.set(key, json.dumps({"category": categories[index]}))
+    return categories
+
+# ------------------------------------------------
+# Micro-batcher
+# ------------------------------------------------
+# configurable keys that change how the model is called; a batch is sent with
+# one request's config, so only requests that agree on all of them are mixed
+CALL_SETTINGS = ("llm", "model", "cache", "structured_output", "scheduler")
+
+
+def _call_settings(config):
+    configurable = (config or {}).get("configurable", {})
+    settings = []
+    for name in CALL_SETTINGS:
+        value = configurable.get(name)
+        # Clients, caches and schedulers are compared by identity
+        hashable = value if value is None or isinstance(value, (str, bool, int, float)) else ("id", id(value))
+        settings.append((name in configurable, hashable))
+    return tuple(settings)
+
+
+class ClassificationBatcher:
+    """Coalesces concurrent classification requests into multi-ticket calls.
+
+    The first request opens a window of `window` seconds; the batch is sent
+    when the window closes or `max_batch` requests have arrived, whichever
+    comes first. Up to `max_in_flight` batches run at once, so a slow call
+    does not hold up the next window. Requests whose configs call the model
+    differently (see CALL_SETTINGS) are never mixed in one call.
+    """
+
+    def __init__(self, window=0.02, max_batch=16, max_in_flight=4):
+        self.window = window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._closed = False
+        self._executor = ThreadPoolExecutor(max_in_flight, thread_name_prefix="classify-batch")
+        self._thread = threading.Thread(target=self._run, name="classify-batcher", daemon=True)
+        self._thread.start()
+
+    def classify(self, ticket, config=None):
+        """Block until the ticket's batch has been classified and return its category"""
+        if self._closed:
+            raise RuntimeError("ClassificationBatcher is closed")
+        future = Future()
+        self._queue.put((time.monotonic(), ticket, config, future))
+        return future.result()
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = first[0] + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = self._collect(item)
+            groups = {}
+            for request in batch:
+                groups.setdefault(_call_settings(request[2]), []).append(request)
+            for group in groups.values():
+                self._executor.submit(self._dispatch, group)
+
+    def _dispatch(self, group):
+        sent_at = time.monotonic()
+        if metrics.enabled():
+            metrics.CLASSIFY_BATCH_SIZE.observe(len(group))
+            metrics.CLASSIFY_BATCH_FILL.observe(len(group) / self.max_batch)
+            for enqueued_at, _, _, _ in group:
+                metrics.CLASSIFY_QUEUE_DELAY.observe(sent_at - enqueued_at)
+        try:
+            categories = classify_many([request[1] for request in group], group[0][2])
+        except Exception as e:
+            for request in group:
+                request[3].set_exception(e)
+            return
+        for request, category in zip(group, categories):
+            request[3].set_result(category)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_classify_batcher(config=None):
+    """The batcher for a node call, or None to classify each ticket on its own.
+
+    configurable["classify_batcher"] may pass an explicit batcher (or None).
+    Otherwise CLASSIFY_BATCH_WINDOW_MS > 0 enables a process-wide batcher
+    with batches of up to CLASSIFY_BATCH_SIZE tickets (default 16).
+    """
+    configurable = (config or {}).get("configurable", {})
+    if "classify_batcher" in configurable:
+        return configurable["classify_batcher"] or None
+    window_ms = float(os.getenv("CLASSIFY_BATCH_WINDOW_MS", "0") or 0)
+    if window_ms <= 0:
+        return None
+
+    global _batcher
+    if _batcher is None:
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = ClassificationBatcher(
+                    window=window_ms / 1000,
+                    max_batch=int(os.getenv("CLASSIFY_BATCH_SIZE", "16"))
+                )
+                logger.info(
+                    f"Micro-batching classification: {window_ms:g} ms window, up to {_batcher.max_batch} tickets"
+                )
+    return _batcher
@@ -0,0 +1,79 @@
+import os
+import re
+
+DEFAULT_MAX_DRAFT_CHARS = 2000
+
+# Commitments an agent must not make; a negated guarantee or promise
+# ("we don't guarantee", "we are unable to promise") is fine
+FORBIDDEN_PROMISES = re.compile(
+    r"\b(?P<word>guarantee[sd]?|promise[sd]?)\b"
+    r"|\b100\s*%"
+    r"|\bwill\s+never\s+happen\s+again\b"
+    r"|\brefund\s+(?:is\s+)?guaranteed\b",
+    re.IGNORECASE
+)
+# A negation up to three words before the match within the same clause,
+# e.g. "cannot fully guarantee" or "won't be able to guarantee"
+_NEGATION_BEFORE = re.compile(
+    r"\b(?:not|never|no|cannot|can't|don't|doesn't|didn't|won't|wouldn't|couldn't|isn't|aren't|"
+    r"unable\s+to|neither|nor|nothing|none)(?:[\s'-]+\w+){0,3}?\s+$",
+    re.IGNORECASE
+)
+_NEGATION_WINDOW = 40
+# Longest text a FORBIDDEN_PROMISES match can span; rescanned when a chunk arrives
+_PROMISE_OVERLAP = 40
+
+
+def find_forbidden_promise(text, start=0):
+    """First affirmative forbidden commitment in `text` at or after `start`, or None"""
+    for match in FORBIDDEN_PROMISES.finditer(text, start):
+        preceding = text[max(0, match.start() - _NEGATION_WINDOW):match.start()]
+        if match.group("word") and _NEGATION_BEFORE.search(preceding):
+            continue
+        return match
+    return None
+
+# Emails, URLs and phone numbers (including vanity numbers like 1-800-BILLING)
+CONTACT_PATTERN = re.compile(
+    r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+"
+    r"|https?://\S+"
+    r"|\b1-800-[A-Z0-9-]+"
+    r"|\+?\d[\d\s().-]{7,}\d"
+)
+
+
+def get_max_draft_chars(config=None):
+    configurable = (config or {}).get("configurable", {})
+    return int(configurable.get("max_draft_chars") or os.getenv("DRAFT_MAX_CHARS", DEFAULT_MAX_DRAFT_CHARS))
+
+
+class DraftMonitor:
+    """Cheap local review of a draft while it streams in.
+
+    feed(chunk) reports a problem as soon as one is visible (length cap,
+    forbidden promise) so generation can stop early; finish() runs the checks
+    that need the whole draft (contact details from the docs are mentioned).
+    Problems are returned as reviewer-style feedback strings, None if fine.
+    """
+
+    def __init__(self, docs, max_chars=DEFAULT_MAX_DRAFT_CHARS):
+        self.contacts = sorted({contact.rstrip(".,;)") for doc in docs for contact in CONTACT_PATTERN.findall(doc)})
+        self.max_chars = max_chars
+        self.text = ""
+        self._scanned = 0
+
+    def feed(self, chunk):
+        self.text += chunk
+        if self.max_chars and len(self.text) > self.max_chars:
+            return f"The response is longer than {self.max_chars} characters; keep it concise."
+        match = find_forbidden_promise(self.text, max(0, self._scanned - _PROMISE_OVERLAP))
+        self._scanned = len(self.text)
+        if match:
+            return f"Do not promise what support cannot guarantee (found \"{match.group(0)}\")."
+        return None
+
+    def finish(self):
+        text = self.text.lower()
+        if self.contacts and not any(contact.lower() in text for contact in self.contacts):
+            return f"Include the relevant support contact details: {', '.join(self.contacts)}."
+        return None
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from knowledge_base import DEFAULT_KB_PATH, knowledge_base_version, load_knowledge_base, tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "data", "embeddings"
+)
+MANIFEST_FILE = "manifest.json"
+
+# ------------------------------------------------
+# Local deterministic embedder
+# ------------------------------------------------
+class HashingEmbedder:
+    """Signed feature hashing of words and character n-grams.
+
+    Runs fully offline and always produces the same vector for the same text.
+    Character n-grams let inflections ("charged" / "charge", "crashes" /
+    "crash") land near each other without a trained model.
+    """
+
+    name = "hashing-v1"
+
+    def __init__(self, dim=256, ngram=4):
+        self.dim = dim
+        self.ngram = ngram
+
+    def _features(self, text):
+        for word in tokenize(text):
+            yield "w:" + word
+            padded = f"<{word}>"
+            for i in range(max(1, len(padded) - self.ngram + 1)):
+                yield "c:" + padded[i:i + self.ngram]
+
+    def embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.dim] += 1.0 if (value >> 63) & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm:
+            vector /= norm
+        return vector
+
+    def embed_batch(self, texts):
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.stack([self.embed(text) for text in texts])
+
+
+def document_text(doc):
+    return f"{doc.get('title', '')} {' '.join(doc.get('keywords', []))} {doc.get('content', '')}"
+
+# ------------------------------------------------
+# Memory-mapped embedding index
+# ------------------------------------------------
+def knowledge_base_fingerprint(knowledge_base):
+    payload = json.dumps(knowledge_base, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _build_name(manifest):
+    return f"{manifest['fingerprint'][:16]}-{manifest['embedder']}-{manifest['dim']}"
+
+
+def _prune_builds(index_dir, keep):
+    """Remove old build directories, keeping the names in `keep`.
+
+    A process that already mapped an old build's matrices keeps reading them
+    after the files are unlinked; the previous build is kept as well for one
+    that read the old manifest but has not opened the matrices yet.
+    """
+    for name in os.listdir(index_dir):
+        path = os.path.join(index_dir, name)
+        if name not in keep and os.path.isdir(path) and not name.startswith("."):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def build_embedding_index(knowledge_base, index_dir, embedder):
+    """Write one float32 `.npy` matrix per category plus a manifest.
+
+    The matrices are written to a temporary directory and renamed into a
+    build directory named after the knowledge base fingerprint, then the
+    manifest pointing at it is swapped in with os.replace. Processes sharing
+    `index_dir` therefore never map a half-written or overwritten matrix,
+    and two processes rebuilding at once produce the same build.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    manifest = {
+        "embedder": embedder.name,
+        "dim": embedder.dim,
+        "fingerprint": knowledge_base_fingerprint(knowledge_base),
+        "categories": {},
+    }
+    manifest["build"] = build = _build_name(manifest)
+    build_dir = os.path.join(index_dir, build)
+
+    staging = tempfile.mkdtemp(prefix=".build-", dir=index_dir)
+    try:
+        for category, docs in knowledge_base.items():
+            key = category.strip().lower()
+            matrix = embedder.embed_batch([document_text(doc) for doc in docs])
+            np.save(os.path.join(staging, f"{key}.npy"), matrix)
+            manifest["categories"][key] = docs
+        try:
+            os.rename(staging, build_dir)
+        except OSError:
+            # Another process finished the same build first
+            if not os.path.isdir(build_dir):
+                raise
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+    previous = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            previous = json.load(file).get("build")
+    fd, tmp_path = tempfile.mkstemp(prefix=".manifest-", suffix=".json", dir=index_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    _prune_builds(index_dir, keep={build, previous})
+    logger.info(f"Built embedding index in {build_dir} for {len(manifest['categories'])} categories")
+    return manifest
+
+
+class EmbeddingIndex:
+    """Cosine-similarity retrieval over memory-mapped per-category matrices"""
+
+    def __init__(self, index_dir, embedder, min_score=0.1):
+        with open(os.path.join(index_dir, MANIFEST_FILE), "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+        self.embedder = embedder
+        self.min_score = min_score
+        self.docs = manifest["categories"]
+        self.version = knowledge_base_version(self.docs)
+        # Indexes written before builds were versioned keep their matrices at the top level
+        build_dir = os.path.join(index_dir, manifest.get("build", ""))
+        # mmap_mode keeps startup near zero-copy; pages are loaded on first use
+        self.matrices = {
+            category: np.load(os.path.join(build_dir, f"{category}.npy"), mmap_mode="r")
+            for category in self.docs
+        }
+
+    def _top_k(self, scores, k):
+        """Indices of the k best scores per row, best first"""
+        k = min(k, scores.shape[-1])
+        if k < scores.shape[-1]:
+            candidates = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        else:
+            candidates = np.broadcast_to(np.arange(scores.shape[-1]), scores.shape)
+        candidate_scores = np.take_along_axis(scores, candidates, axis=-1)
+        order = np.argsort(-candidate_scores, axis=-1, kind="stable")
+        return np.take_along_axis(candidates, order, axis=-1)
+
+    def search_batch(self, category, texts, k=3, fallback=2):
+        """Score many tickets against one category with a single matrix multiply"""
+        matrix = self.matrices.get(category)
+        if matrix is None:
+            return [[] for _ in texts]
+        docs = self.docs[category]
+        if not len(docs):
+            return [[] for _ in texts]
+
+        scores = self.embedder.embed_batch(texts) @ matrix.T
+        results = []
+        for row, top in zip(scores, self._top_k(scores, k)):
+            hits = [docs[i] for i in top if row[i] > self.min_score]
+            results.append(hits or docs[:fallback])
+        return results
+
+    def search(self, category, text, k=3, fallback=2):
+        return self.search_batch(category, [text], k=k, fallback=fallback)[0]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_embedding_index():
+    """Open the on-disk index, (re)building it when the knowledge base changed"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                kb_path = os.getenv("KNOWLEDGE_BASE_PATH", DEFAULT_KB_PATH)
+                index_dir = os.getenv("EMBEDDING_INDEX_DIR", DEFAULT_INDEX_DIR)
+                embedder = HashingEmbedder(dim=int(os.getenv("EMBEDDING_DIM", "256")))
+                knowledge_base = load_knowledge_base(kb_path)
+
+                manifest_path = os.path.join(index_dir, MANIFEST_FILE)
+                stale = True
+                if os.path.exists(manifest_path):
+                    with open(manifest_path, "r", encoding="utf-8") as file:
+                        manifest = json.load(file)
+                    stale = (
+                        manifest.get("fingerprint") != knowledge_base_fingerprint(knowledge_base)
+                        or manifest.get("embedder") != embedder.name
+                        or manifest.get("dim") != embedder.dim
+                    )
+                if stale:
+                    build_embedding_index(knowledge_base, index_dir, embedder)
+                _index = EmbeddingIndex(index_dir, embedder)
+    return _index
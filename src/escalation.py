@@ -0,0 +1,290 @@
+import atexit
+import csv
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+FIELDNAMES = [
+    "timestamp",
+    "subject",
+    "description",
+    "category",
+    "attempts",
+    "final_draft",
+    "reviewer_feedback",
+    "retrieved_context",
+    "kb_version",
+]
+
+# ------------------------------------------------
+# Sinks
+# ------------------------------------------------
+class CsvSink:
+    """Append-only CSV file, rotated by size and/or calendar day"""
+
+    def __init__(self, path, rotate_bytes=0, rotate_daily=False):
+        self.path = path
+        self.rotate_bytes = rotate_bytes
+        self.rotate_daily = rotate_daily
+        self._file = None
+        self._writer = None
+        self._opened_on = None
+
+    def _header(self):
+        with open(self.path, newline="", encoding="utf-8") as file:
+            return next(csv.reader(file), [])
+
+    def _open(self):
+        needs_header = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        if not needs_header and self._header() != FIELDNAMES:
+            # Written with older columns; start a fresh file rather than misalign rows
+            self._rotate()
+            needs_header = True
+        self._file = open(self.path, mode="a", newline="", encoding="utf-8")
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDNAMES, extrasaction="ignore")
+        self._opened_on = datetime.now().date()
+        if needs_header:
+            self._writer.writeheader()
+
+    def _should_rotate(self):
+        if self.rotate_daily and self._opened_on != datetime.now().date():
+            return True
+        return bool(self.rotate_bytes) and self._file.tell() >= self.rotate_bytes
+
+    def _rotate(self):
+        self.close()
+        root, ext = os.path.splitext(self.path)
+        rotated = f"{root}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}{ext}"
+        os.replace(self.path, rotated)
+        logger.info(f"Rotated escalation log to {rotated}")
+
+    def write_rows(self, rows):
+        if self._file is None:
+            self._open()
+        elif self._should_rotate():
+            self._rotate()
+            self._open()
+        self._writer.writerows(rows)
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+
+class SqliteSink:
+    """Escalations as rows of a queryable SQLite table"""
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+
+    def _connect(self):
+        # Opened lazily so the connection belongs to the writer thread. Worker
+        # processes may share the file, so wait on their locks
+        self._db = sqlite3.connect(self.path, timeout=30)
+        columns = ", ".join(f"{name} TEXT" for name in FIELDNAMES)
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS escalations (id INTEGER PRIMARY KEY, {columns})")
+        existing = {row[1] for row in self._db.execute("PRAGMA table_info(escalations)")}
+        for name in FIELDNAMES:
+            if name not in existing:
+                try:
+                    self._db.execute(f"ALTER TABLE escalations ADD COLUMN {name} TEXT")
+                except sqlite3.OperationalError:
+                    # Another process added it first
+                    pass
+        self._db.commit()
+
+    def write_rows(self, rows):
+        if self._db is None:
+            self._connect()
+        placeholders = ", ".join("?" for _ in FIELDNAMES)
+        self._db.executemany(
+            f"INSERT INTO escalations ({', '.join(FIELDNAMES)}) VALUES ({placeholders})",
+            [tuple(str(row.get(name, "")) for name in FIELDNAMES) for row in rows]
+        )
+
+    def flush(self):
+        if self._db is not None:
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+
+class ParquetSink:
+    """One Parquet part file per flushed batch inside a directory (needs pyarrow)"""
+
+    def __init__(self, path):
+        import pyarrow  # noqa: F401 - fail fast if the optional dependency is missing
+
+        self.path = path
+        self._pending = []
+        self._parts = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write_rows(self, rows):
+        self._pending.extend(rows)
+
+    def flush(self):
+        if not self._pending:
+            return
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table({name: [str(row.get(name, "")) for row in self._pending] for name in FIELDNAMES})
+        self._parts += 1
+        part = os.path.join(
+            self.path, f"escalations-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._parts}.parquet"
+        )
+        pq.write_table(table, part)
+        self._pending = []
+
+    def close(self):
+        self.flush()
+
+# ------------------------------------------------
+# Background writer
+# ------------------------------------------------
+_STOP = object()
+
+
+class EscalationWriter:
+    """Single background thread that drains a queue of escalation rows.
+
+    Rows are written in batches of up to `batch_size` and the sink is flushed
+    (fsync for CSV) at least every `flush_interval` seconds, so callers never
+    block on file I/O and concurrent tickets cannot interleave rows.
+    """
+
+    def __init__(self, sink, batch_size=100, flush_interval=1.0, max_queue=10000):
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name="escalation-writer", daemon=True)
+        self._closed = False
+        self._thread.start()
+
+    @property
+    def location(self):
+        return self.sink.path
+
+    def submit(self, row):
+        if self._closed:
+            raise RuntimeError("Escalation writer is closed")
+        self._queue.put(row)
+
+    def _write(self, batch):
+        try:
+            self.sink.write_rows(batch)
+            self.sink.flush()
+        except Exception as e:
+            logger.error(f"Failed to write {len(batch)} escalation row(s): {e}", exc_info=True)
+
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+
+            if item is not None and item is not _STOP:
+                batch.append(item)
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+            if batch:
+                self._write(batch)
+                batch = []
+            deadline = time.monotonic() + self.flush_interval
+            if item is _STOP:
+                break
+        self.sink.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+def build_sink(kind, path, rotate_bytes=0, rotate_daily=False):
+    if kind == "csv":
+        return CsvSink(path, rotate_bytes=rotate_bytes, rotate_daily=rotate_daily)
+    if kind == "sqlite":
+        return SqliteSink(path)
+    if kind == "parquet":
+        return ParquetSink(path)
+    raise ValueError(f"Unknown escalation sink '{kind}', expected csv, sqlite or parquet")
+
+
+DEFAULT_PATHS = {"csv": "escalation_log.csv", "sqlite": "escalations.sqlite", "parquet": "escalations"}
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_escalation_writer():
+    """Process-wide writer configured from the environment.
+
+    ESCALATION_SINK picks csv (default), sqlite or parquet; ESCALATION_PATH
+    overrides the location; ESCALATION_ROTATE_BYTES / ESCALATION_ROTATE_DAILY
+    control CSV rotation; ESCALATION_FLUSH_INTERVAL sets the flush period.
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                kind = os.getenv("ESCALATION_SINK", "csv").strip().lower()
+                sink = build_sink(
+                    kind,
+                    os.getenv("ESCALATION_PATH") or DEFAULT_PATHS.get(kind, ""),
+                    rotate_bytes=int(os.getenv("ESCALATION_ROTATE_BYTES", "0")),
+                    rotate_daily=os.getenv("ESCALATION_ROTATE_DAILY", "").lower() in ("1", "on", "true", "yes")
+                )
+                _writer = EscalationWriter(
+                    sink, flush_interval=float(os.getenv("ESCALATION_FLUSH_INTERVAL", "1.0"))
+                )
+                atexit.register(close_escalation_writer)
+    return _writer
+
+
+def close_escalation_writer():
+    """Flush pending rows and stop the writer; a new one starts on next use"""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        writer.close()
+
+
+def escalation_row(ticket, category, attempts, draft, feedback, docs, kb_version=""):
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "subject": ticket.get("subject", ""),
+        "description": ticket.get("description", ""),
+        "category": category,
+        "attempts": attempts,
+        "final_draft": draft,
+        "reviewer_feedback": feedback,
+        "retrieved_context": "; ".join(docs),
+        "kb_version": kb_version,
+    }
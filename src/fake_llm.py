@@ -0,0 +1,262 @@
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+# ------------------------------------------------
+# Local fake chat model for tests and benchmarks
+# ------------------------------------------------
+def prompt_kind(prompt):
+    """Which node a prompt came from: "classify_batch", "classify", "compose", "review" or "draft" """
+    if prompt.startswith("Classify each"):
+        return "classify_batch"
+    if prompt.startswith("Classify"):
+        return "classify"
+    if "Self-Assessment" in prompt:
+        return "compose"
+    if "QA reviewer" in prompt:
+        return "review"
+    return "draft"
+
+
+def batch_size(prompt):
+    return len(re.findall(r"^Ticket \d+:", prompt, re.MULTILINE))
+
+
+def batch_categories(prompt, category):
+    return json.dumps({"categories": [
+        {"index": index, "category": category} for index in range(1, batch_size(prompt) + 1)
+    ]})
+
+
+def default_responder(prompt):
+    """Answer each node's prompt with a plausible fixed response"""
+    kind = prompt_kind(prompt)
+    if kind == "classify_batch":
+        return batch_categories(prompt, "Technical")
+    if kind == "classify":
+        return "Technical"
+    if kind == "review":
+        return "approved - the response is accurate and helpful."
+    if kind == "compose":
+        return json.dumps({
+            "draft": "Thanks for reaching out. Please clear the app cache and restart your device.",
+            "self_score": 0.9,
+            "issues": ""
+        })
+    return "Thanks for reaching out. Please clear the app cache and restart your device."
+
+
+class ScriptedResponder:
+    """Structured answers with scripted review outcomes.
+
+    `review_outcomes` (e.g. ["rejected", "approved"]) picks the outcome by the
+    attempt number in the review prompt; otherwise each review is approved
+    with probability `approve_rate`, decided by a hash of the prompt so the
+    result is reproducible regardless of thread scheduling.
+    """
+
+    def __init__(self, review_outcomes=None, approve_rate=1.0, category="Technical", seed=0):
+        self.review_outcomes = list(review_outcomes or [])
+        self.approve_rate = approve_rate
+        self.category = category
+        self.seed = seed
+
+    def _approved(self, prompt):
+        if self.review_outcomes:
+            match = re.search(r"Attempt: (\d+)", prompt)
+            attempt = int(match.group(1)) if match else 1
+            return self.review_outcomes[min(attempt, len(self.review_outcomes)) - 1] == "approved"
+        digest = hashlib.blake2b(f"{self.seed}:{prompt}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") / 2 ** 64 < self.approve_rate
+
+    def __call__(self, prompt):
+        kind = prompt_kind(prompt)
+        if kind == "classify_batch":
+            return batch_categories(prompt, self.category)
+        if kind == "classify":
+            return json.dumps({"category": self.category})
+        if kind == "review":
+            if self._approved(prompt):
+                return json.dumps({"status": "approved", "feedback": "Accurate and helpful."})
+            return json.dumps({"status": "rejected", "feedback": "Add concrete next steps."})
+        if kind == "compose":
+            # Self-assessment follows the same scripted outcome as a review would
+            approved = self._approved(prompt)
+            return json.dumps({
+                "draft": "Thanks for reaching out. Please clear the app cache and restart your device.",
+                "self_score": 0.9 if approved else 0.4,
+                "issues": "" if approved else "Missing concrete next steps."
+            })
+        return "Thanks for reaching out. Please clear the app cache and restart your device."
+
+# ------------------------------------------------
+# Latency distributions
+# ------------------------------------------------
+def parse_latency(spec, seed=0):
+    """Build a latency sampler (seconds) from a spec string.
+
+    "0.2" or "constant:0.2", "uniform:LOW:HIGH", "normal:MEAN:STDDEV",
+    "lognormal:MEDIAN:SIGMA".
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    kind, _, args = str(spec).partition(":")
+    if not args:
+        kind, args = "constant", kind
+    values = [float(value) for value in args.split(":")]
+
+    if kind == "constant":
+        return lambda: values[0]
+    if kind == "uniform":
+        sample = lambda: rng.uniform(values[0], values[1])  # noqa: E731
+    elif kind == "normal":
+        sample = lambda: max(0.0, rng.gauss(values[0], values[1]))  # noqa: E731
+    elif kind == "lognormal":
+        import math
+
+        sample = lambda: rng.lognormvariate(math.log(values[0]), values[1])  # noqa: E731
+    else:
+        raise ValueError(f"Unknown latency distribution '{kind}'")
+
+    def sampler():
+        with lock:
+            return sample()
+    return sampler
+
+
+class FakeChatModel:
+    """Drop-in stand-in for ChatGoogleGenerativeAI that never touches the network.
+
+    `setup_latency` is paid once in the constructor to mimic client and
+    connection setup; `latency` is paid on every invoke. `latency` may be a
+    number, a zero-argument sampler, or a dict of either keyed by prompt_kind.
+    """
+
+    def __init__(self, model="fake", temperature=0, latency=0.0, setup_latency=0.0, responder=None):
+        self.model = model
+        self.temperature = temperature
+        self.latency = latency
+        self.responder = responder or default_responder
+        self.calls = 0
+        self._lock = threading.Lock()
+        if setup_latency:
+            time.sleep(setup_latency)
+
+    def _delay(self, prompt):
+        latency = self.latency
+        if isinstance(latency, dict):
+            latency = latency.get(prompt_kind(prompt), 0.0)
+        return latency() if callable(latency) else latency
+
+    def invoke(self, prompt, config=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+        delay = self._delay(prompt)
+        if delay:
+            time.sleep(delay)
+        return AIMessage(content=self.responder(prompt))
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        import asyncio
+
+        with self._lock:
+            self.calls += 1
+        delay = self._delay(prompt)
+        if delay:
+            await asyncio.sleep(delay)
+        return AIMessage(content=self.responder(prompt))
+
+    def stream(self, prompt, config=None, **kwargs):
+        """Yield the response word by word, spreading the latency across the chunks"""
+        with self._lock:
+            self.calls += 1
+        pieces = re.findall(r"\S+\s*", self.responder(prompt)) or [""]
+        delay = self._delay(prompt)
+        for piece in pieces:
+            if delay:
+                time.sleep(delay / len(pieces))
+            yield AIMessageChunk(content=piece)
+
+
+def fake_factory(latency=0.0, setup_latency=0.0, responder=None):
+    """Build a factory suitable for llm.set_model_factory"""
+    def factory(model, temperature):
+        return FakeChatModel(
+            model=model,
+            temperature=temperature,
+            latency=latency,
+            setup_latency=setup_latency,
+            responder=responder
+        )
+    return factory
+
+# ------------------------------------------------
+# Fault injection
+# ------------------------------------------------
+class FakeRateLimitError(Exception):
+    """Raised by FlakyChatModel when it throttles; carries a 429 like provider errors"""
+    status_code = 429
+
+
+class FlakyChatModel:
+    """Wraps a fake model and injects provider misbehaviour.
+
+    `max_rps` rejects calls beyond that many per rolling second, like a
+    server-side quota; `throttle_rate` rejects a random share of calls; and
+    `slow_rate` adds `slow_latency` seconds to a random share to build a p99 tail.
+    """
+
+    def __init__(self, model=None, max_rps=None, throttle_rate=0.0, slow_rate=0.0, slow_latency=1.0, seed=0):
+        from collections import deque
+
+        self.model = model or FakeChatModel()
+        self.max_rps = max_rps
+        self.throttle_rate = throttle_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.throttled = 0
+        self._recent = deque()
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @property
+    def calls(self):
+        return self.model.calls
+
+    def _admit(self):
+        """Raise when throttling this call; otherwise return its extra delay"""
+        with self._lock:
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] >= 1.0:
+                self._recent.popleft()
+            over_quota = self.max_rps is not None and len(self._recent) >= self.max_rps
+            if over_quota or self._rng.random() < self.throttle_rate:
+                self.throttled += 1
+                raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: quota exceeded (fake)")
+            self._recent.append(now)
+            return self.slow_latency if self._rng.random() < self.slow_rate else 0.0
+
+    def invoke(self, prompt, config=None, **kwargs):
+        delay = self._admit()
+        if delay:
+            time.sleep(delay)
+        return self.model.invoke(prompt, config, **kwargs)
+
+    async def ainvoke(self, prompt, config=None, **kwargs):
+        import asyncio
+
+        delay = self._admit()
+        if delay:
+            await asyncio.sleep(delay)
+        return await self.model.ainvoke(prompt, config, **kwargs)
+
+    def stream(self, prompt, config=None, **kwargs):
+        delay = self._admit()
+        if delay:
+            time.sleep(delay)
+        yield from self.model.stream(prompt, config, **kwargs)
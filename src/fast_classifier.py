@@ -0,0 +1,193 @@
+import json
+import logging
+import math
+import os
+import threading
+
+from knowledge_base import DEFAULT_KB_PATH, load_knowledge_base, tokenize
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 0.65
+
+# ------------------------------------------------
+# Keyword rules built from the knowledge base
+# ------------------------------------------------
+class KeywordRuleClassifier:
+    """Scores categories by the knowledge base keywords found in a ticket.
+
+    A keyword shared by several categories is worth proportionally less.
+    Confidence is top / (total + 1): one strong hit is not enough on its own,
+    while several hits that agree on a category quickly approach 1.
+    """
+
+    def __init__(self, knowledge_base):
+        owners = {}
+        for category, docs in knowledge_base.items():
+            label = category.strip().capitalize()
+            for doc in docs:
+                for keyword in doc.get("keywords", []):
+                    for term in tokenize(keyword):
+                        owners.setdefault(term, set()).add(label)
+        self.weights = {
+            term: {label: 1.0 / len(labels) for label in labels}
+            for term, labels in owners.items()
+        }
+
+    def classify(self, text):
+        scores = {}
+        for term in set(tokenize(text)):
+            for label, weight in self.weights.get(term, {}).items():
+                scores[label] = scores.get(label, 0.0) + weight
+        if not scores:
+            return None, 0.0
+        label, top = max(scores.items(), key=lambda item: item[1])
+        return label, top / (sum(scores.values()) + 1.0)
+
+# ------------------------------------------------
+# Optional trained linear model
+# ------------------------------------------------
+class LinearTicketModel:
+    """Multinomial naive Bayes, i.e. a linear model over token counts in log space"""
+
+    def __init__(self, priors, weights, default_weights):
+        self.priors = priors                    # label -> log prior
+        self.weights = weights                  # label -> {term: log likelihood}
+        self.default_weights = default_weights  # label -> log likelihood of unseen terms
+
+    @classmethod
+    def train(cls, examples, smoothing=1.0):
+        """`examples` is an iterable of (text, label) pairs"""
+        counts = {}
+        totals = {}
+        documents = {}
+        vocabulary = set()
+        for text, label in examples:
+            documents[label] = documents.get(label, 0) + 1
+            label_counts = counts.setdefault(label, {})
+            for term in tokenize(text):
+                label_counts[term] = label_counts.get(term, 0) + 1
+                totals[label] = totals.get(label, 0) + 1
+                vocabulary.add(term)
+
+        total_documents = sum(documents.values())
+        priors, weights, default_weights = {}, {}, {}
+        for label, label_counts in counts.items():
+            denominator = totals.get(label, 0) + smoothing * len(vocabulary)
+            priors[label] = math.log(documents[label] / total_documents)
+            default_weights[label] = math.log(smoothing / denominator)
+            weights[label] = {
+                term: math.log((count + smoothing) / denominator) for term, count in label_counts.items()
+            }
+        return cls(priors, weights, default_weights)
+
+    def classify(self, text):
+        terms = tokenize(text)
+        if not terms or not self.priors:
+            return None, 0.0
+        logits = {
+            label: prior + sum(self.weights[label].get(term, self.default_weights[label]) for term in terms)
+            for label, prior in self.priors.items()
+        }
+        peak = max(logits.values())
+        exp = {label: math.exp(logit - peak) for label, logit in logits.items()}
+        label = max(exp, key=exp.get)
+        return label, exp[label] / sum(exp.values())
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"priors": self.priors, "weights": self.weights, "default_weights": self.default_weights},
+                file
+            )
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as file:
+            data = json.load(file)
+        return cls(data["priors"], data["weights"], data["default_weights"])
+
+# ------------------------------------------------
+# Tiered fast path
+# ------------------------------------------------
+class FastClassifier:
+    """Keyword rules first, then the optional linear model.
+
+    Returns (category, confidence, source); callers fall back to the LLM when
+    the confidence is below their threshold.
+    """
+
+    def __init__(self, rules, model=None):
+        self.rules = rules
+        self.model = model
+        self._lock = threading.Lock()
+        self.counts = {"rules": 0, "model": 0, "llm": 0}
+
+    def classify(self, text, threshold=DEFAULT_THRESHOLD):
+        category, confidence = self.rules.classify(text)
+        source = "rules"
+        if confidence < threshold and self.model is not None:
+            model_category, model_confidence = self.model.classify(text)
+            if model_confidence > confidence:
+                category, confidence, source = model_category, model_confidence, "model"
+        return category, confidence, source
+
+    def record(self, source):
+        with self._lock:
+            self.counts[source] += 1
+
+    def stats(self):
+        with self._lock:
+            total = sum(self.counts.values())
+            fast = total - self.counts["llm"]
+            return {**self.counts, "fast_path_share": round(fast / total, 4) if total else 0.0}
+
+
+def get_threshold(config=None):
+    configurable = (config or {}).get("configurable", {})
+    value = configurable.get("fast_path_threshold")
+    if value is None:
+        value = os.getenv("FAST_PATH_THRESHOLD", DEFAULT_THRESHOLD)
+    return float(value)
+
+
+_classifier = None
+_classifier_lock = threading.Lock()
+
+
+def get_fast_classifier():
+    """Build the fast path once per process (FAST_CLASSIFIER_MODEL adds the trained model)"""
+    global _classifier
+    if _classifier is None:
+        with _classifier_lock:
+            if _classifier is None:
+                knowledge_base = load_knowledge_base(os.getenv("KNOWLEDGE_BASE_PATH", DEFAULT_KB_PATH))
+                model_path = os.getenv("FAST_CLASSIFIER_MODEL")
+                model = LinearTicketModel.load(model_path) if model_path else None
+                _classifier = FastClassifier(KeywordRuleClassifier(knowledge_base), model)
+    return _classifier
+
+
+def train_from_jsonl(input_path, output_path):
+    """Train the linear model from JSONL lines with subject, description and category"""
+    def examples():
+        with open(input_path, "r", encoding="utf-8") as file:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    text = f"{record.get('subject', '')} {record.get('description', '')}"
+                    yield text, record["category"].strip().capitalize()
+
+    model = LinearTicketModel.train(examples())
+    model.save(output_path)
+    return model
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python src/fast_classifier.py LABELED_TICKETS.jsonl MODEL.json")
+        sys.exit(1)
+    trained = train_from_jsonl(sys.argv[1], sys.argv[2])
+    print(f"Trained linear model for {sorted(trained.priors)} -> {sys.argv[2]}")
@@ -0,0 +1,653 @@
+import hashlib
+import heapq
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_KB_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "data", "knowledge_base.json"
+)
+
+# BM25 parameters and the weight of a keyword hit relative to a content hit
+BM25_K1 = 1.2
+BM25_B = 0.75
+KEYWORD_WEIGHT = 2
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-/][a-z0-9]+)*")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do for from has have how i if in is it "
+    "my me of on or our so that the this to was we with you your".split()
+)
+
+
+def tokenize(text):
+    return [term for term in TOKEN_PATTERN.findall(text.lower()) if term not in STOPWORDS]
+
+# ------------------------------------------------
+# Document identity and versions
+# ------------------------------------------------
+def doc_keys(docs):
+    """Stable key per document of a category: its "id", else its title.
+
+    Repeated keys get a "#2", "#3" ... suffix in order of appearance.
+    """
+    keys, seen = [], {}
+    for position, doc in enumerate(docs):
+        key = str(doc.get("id") or doc.get("title") or position)
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key}#{seen[key]}")
+    return keys
+
+
+def doc_fingerprint(doc):
+    payload = json.dumps(doc, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def _version(entries):
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update("\t".join(entry).encode("utf-8") + b"\n")
+    return digest.hexdigest()[:12]
+
+
+def knowledge_base_version(knowledge_base):
+    """Content hash of a knowledge base; identical content gives the same version in every worker"""
+    return _version(
+        (category.strip().lower(), key, doc_fingerprint(doc))
+        for category, docs in knowledge_base.items()
+        for key, doc in zip(doc_keys(docs), docs)
+    )
+
+# ------------------------------------------------
+# Per-category inverted index
+# ------------------------------------------------
+class CategoryIndex:
+    """BM25 postings for the documents of a single category.
+
+    Documents are keyed (see doc_keys) so they can be replaced or removed
+    without rebuilding the rest. A removed document leaves an empty slot,
+    which keeps positions (and so ties in knowledge base order) stable.
+    """
+
+    def __init__(self):
+        self.docs = []          # insertion order, used for the fallback; None for removed slots
+        self.keys = {}          # doc key -> position
+        self.fingerprints = {}  # doc key -> doc_fingerprint
+        self.postings = {}      # term -> {position: weighted term frequency}
+        self.doc_terms = []     # terms indexed for each position, so removal needs no re-tokenizing
+        self.doc_lengths = []
+        self.total_length = 0
+        self._owned = None      # terms whose postings this copy may modify; None means all
+
+    def copy(self):
+        """Copy-on-write clone: postings are shared until a term is modified"""
+        clone = CategoryIndex()
+        clone.docs = list(self.docs)
+        clone.keys = dict(self.keys)
+        clone.fingerprints = dict(self.fingerprints)
+        clone.postings = dict(self.postings)
+        clone.doc_terms = list(self.doc_terms)
+        clone.doc_lengths = list(self.doc_lengths)
+        clone.total_length = self.total_length
+        clone._owned = set()
+        return clone
+
+    def _writable(self, term):
+        postings = self.postings.get(term)
+        if self._owned is not None and term not in self._owned:
+            postings = self.postings[term] = dict(postings or {})
+            self._owned.add(term)
+        elif postings is None:
+            postings = self.postings[term] = {}
+        return postings
+
+    def _unindex(self, position):
+        for term in self.doc_terms[position]:
+            postings = self._writable(term)
+            postings.pop(position, None)
+            if not postings:
+                del self.postings[term]
+        self.total_length -= self.doc_lengths[position]
+        self.doc_lengths[position] = 0
+        self.doc_terms[position] = ()
+        self.docs[position] = None
+
+    def add(self, doc, key=None, fingerprint=None):
+        """Index `doc`, replacing the document with the same key in place"""
+        key = key if key is not None else doc_keys([doc])[0]
+        position = self.keys.get(key)
+        if position is None:
+            position = len(self.docs)
+            self.docs.append(None)
+            self.doc_terms.append(())
+            self.doc_lengths.append(0)
+        else:
+            self._unindex(position)
+
+        frequencies = {}
+        for term in tokenize(" ".join(doc.get("keywords", []))):
+            frequencies[term] = frequencies.get(term, 0) + KEYWORD_WEIGHT
+        for term in tokenize(doc.get("content", "")):
+            frequencies[term] = frequencies.get(term, 0) + 1
+        for term, frequency in frequencies.items():
+            self._writable(term)[position] = frequency
+
+        length = sum(frequencies.values())
+        self.docs[position] = doc
+        self.doc_terms[position] = tuple(frequencies)
+        self.doc_lengths[position] = length
+        self.total_length += length
+        self.keys[key] = position
+        self.fingerprints[key] = fingerprint or doc_fingerprint(doc)
+
+    def remove(self, key):
+        position = self.keys.pop(key)
+        del self.fingerprints[key]
+        self._unindex(position)
+
+    def documents(self):
+        return [doc for doc in self.docs if doc is not None]
+
+    def compacted(self):
+        """This index, or a rebuilt one once empty slots outnumber documents"""
+        if len(self.docs) - len(self.keys) <= max(16, len(self.keys)):
+            return self
+        rebuilt = CategoryIndex()
+        for key, position in sorted(self.keys.items(), key=lambda item: item[1]):
+            rebuilt.add(self.docs[position], key, self.fingerprints[key])
+        return rebuilt
+
+    def search(self, terms, k):
+        if not self.keys:
+            return []
+
+        doc_count = len(self.keys)
+        avg_length = self.total_length / doc_count
+        scores = {}
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for position, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[position] / avg_length)
+                scores[position] = scores.get(position, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        # Ties keep knowledge base order, as the previous stable sort did
+        top = heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
+        return [self.docs[position] for position, _ in top]
+
+# ------------------------------------------------
+# Knowledge base index
+# ------------------------------------------------
+class KnowledgeBaseIndex:
+    """Search index over one version of the knowledge base.
+
+    An index is never modified once built; apply() returns a new one, so a
+    reader holding a reference always sees a single consistent version.
+    """
+
+    def __init__(self, knowledge_base):
+        self.categories = {}
+        for category, docs in knowledge_base.items():
+            index = CategoryIndex()
+            for key, doc in zip(doc_keys(docs), docs):
+                index.add(doc, key)
+            self.categories[category.strip().lower()] = index
+        self.version = self._compute_version()
+
+    def _compute_version(self):
+        return _version(
+            (category, key, fingerprint)
+            for category, index in self.categories.items()
+            for key, fingerprint in index.fingerprints.items()
+        )
+
+    @staticmethod
+    def _keeps_order(current, incoming):
+        """True if updating `current` in place gives the positions a full rebuild
+        would: kept documents in their old order, new documents after them"""
+        last, added = -1, False
+        for key in incoming:
+            position = current.keys.get(key)
+            if position is None:
+                added = True
+            elif added or position < last:
+                return False
+            else:
+                last = position
+        return True
+
+    def apply(self, knowledge_base):
+        """A new index for `knowledge_base`, built as a diff against this one.
+
+        Only added, changed and removed documents are (re)tokenized, and
+        unchanged categories are shared with this index. Returns
+        (index, {"added": n, "changed": n, "removed": n}).
+        """
+        updated = KnowledgeBaseIndex({})
+        changes = {"added": 0, "changed": 0, "removed": 0}
+        for category, docs in knowledge_base.items():
+            name = category.strip().lower()
+            current = self.categories.get(name)
+            incoming = dict(zip(doc_keys(docs), docs))
+            fingerprints = {key: doc_fingerprint(doc) for key, doc in incoming.items()}
+            keeps_order = current is None or self._keeps_order(current, incoming)
+            if keeps_order and current is not None and current.fingerprints == fingerprints:
+                updated.categories[name] = current
+                continue
+
+            if not keeps_order:
+                # Positions decide ties and the fallback, so a reordered category
+                # (or one whose duplicate-title keys shifted) is rebuilt instead
+                index = CategoryIndex()
+                for key, known in current.fingerprints.items():
+                    if key not in incoming:
+                        changes["removed"] += 1
+                    elif known != fingerprints[key]:
+                        changes["changed"] += 1
+                for key, doc in incoming.items():
+                    if key not in current.keys:
+                        changes["added"] += 1
+                    index.add(doc, key, fingerprints[key])
+                updated.categories[name] = index
+                continue
+
+            index = current.copy() if current is not None else CategoryIndex()
+            for key in [key for key in index.keys if key not in incoming]:
+                index.remove(key)
+                changes["removed"] += 1
+            for key, doc in incoming.items():
+                known = index.fingerprints.get(key)
+                if known != fingerprints[key]:
+                    index.add(doc, key, fingerprints[key])
+                    changes["changed" if known else "added"] += 1
+            updated.categories[name] = index.compacted()
+
+        for name, index in self.categories.items():
+            if name not in updated.categories:
+                changes["removed"] += len(index.keys)
+        updated.version = updated._compute_version()
+        return updated, changes
+
+    def search(self, category, text, k=3, fallback=2):
+        """Return the top-k documents for the query within a category.
+
+        If nothing in the category matches, the first `fallback` documents of
+        the category are returned instead. Unknown categories return [].
+        """
+        index = self.categories.get(category)
+        if index is None:
+            return []
+        top_docs = index.search(tokenize(text), k)
+        if not top_docs:
+            top_docs = index.documents()[:fallback]
+        return top_docs
+
+# ------------------------------------------------
+# Knowledge base stores
+# ------------------------------------------------
+DOC_EXTENSIONS = (".json", ".md", ".markdown")
+SQLITE_EXTENSIONS = (".sqlite", ".sqlite3", ".db")
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class FileStore:
+    """A single JSON (or YAML) file mapping each category to its documents"""
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+
+    def changed(self):
+        return _file_signature(self.path) != self._signature
+
+    def load(self):
+        signature = _file_signature(self.path)
+        with open(self.path, "r", encoding="utf-8") as file:
+            if self.path.endswith((".yaml", ".yml")):
+                import yaml
+
+                knowledge_base = yaml.safe_load(file)
+            else:
+                knowledge_base = json.load(file)
+        self._signature = signature
+        return knowledge_base
+
+    def close(self):
+        pass
+
+
+def parse_markdown_doc(text, default_title):
+    """A document from Markdown with an optional "key: value" front matter block.
+
+    Without a `title` in the front matter, the first "# " heading is used.
+    `keywords` is a comma-separated list.
+    """
+    doc = {}
+    match = re.match(r"---\s*\n(.*?)\n---\s*\n", text, re.DOTALL)
+    if match:
+        for line in match.group(1).splitlines():
+            name, separator, value = line.partition(":")
+            if separator:
+                doc[name.strip().lower()] = value.strip()
+        text = text[match.end():]
+    if "title" not in doc:
+        heading = re.match(r"\s*#\s+(.+)\n?", text)
+        doc["title"] = heading.group(1).strip() if heading else default_title
+        text = text[heading.end():] if heading else text
+    keywords = doc.get("keywords", "")
+    doc["keywords"] = [keyword.strip() for keyword in keywords.split(",") if keyword.strip()]
+    doc["content"] = text.strip()
+    return doc
+
+
+_ORDINAL_PREFIX = re.compile(r"(\d+)-(.+)")
+
+
+def _file_order(name):
+    """Sort key for document files: an ordinal prefix ("010-refunds.md") first, then the name"""
+    match = _ORDINAL_PREFIX.fullmatch(name)
+    return (0, int(match.group(1)), name) if match else (1, 0, name)
+
+
+class DirectoryStore:
+    """One file per document under a directory per category.
+
+    `<root>/<category>/<name>.json` holds a document object and
+    `<root>/<category>/<name>.md` a Markdown document (see
+    parse_markdown_doc); the file name is the document id. Document order
+    (which decides the fallback and ties) follows an optional numeric
+    prefix, e.g. `010-refund-policy.md`, which is not part of the id;
+    unprefixed files come after, by name. Files are only re-read when their
+    size or modification time changes.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._signature = None
+        self._parsed = {}  # relative path -> (signature, doc)
+
+    def _files(self):
+        files = {}
+        for category in sorted(os.listdir(self.path)):
+            directory = os.path.join(self.path, category)
+            if not os.path.isdir(directory) or category.startswith("."):
+                continue
+            for name in sorted(os.listdir(directory), key=_file_order):
+                if name.endswith(DOC_EXTENSIONS) and not name.startswith("."):
+                    relative = f"{category}/{name}"
+                    files[relative] = _file_signature(os.path.join(directory, name))
+        return files
+
+    def changed(self):
+        return self._files() != self._signature
+
+    def _parse(self, relative):
+        name = os.path.basename(relative)
+        doc_id = os.path.splitext(name)[0]
+        match = _ORDINAL_PREFIX.fullmatch(doc_id)
+        if match:
+            doc_id = match.group(2)
+        with open(os.path.join(self.path, relative), "r", encoding="utf-8") as file:
+            if name.endswith(".json"):
+                doc = json.load(file)
+            else:
+                doc = parse_markdown_doc(file.read(), doc_id)
+        doc.setdefault("id", doc_id)
+        return doc
+
+    def load(self):
+        files = self._files()
+        parsed = {}
+        knowledge_base = {}
+        for relative, signature in files.items():
+            cached = self._parsed.get(relative)
+            doc = cached[1] if cached and cached[0] == signature else self._parse(relative)
+            parsed[relative] = (signature, doc)
+            knowledge_base.setdefault(relative.split("/", 1)[0], []).append(doc)
+        self._parsed = parsed
+        self._signature = files
+        return knowledge_base
+
+    def close(self):
+        pass
+
+
+class SqliteStore:
+    """Documents as rows of a `documents` table in a SQLite database.
+
+    `keywords` holds a JSON list or a comma-separated string. Changes
+    committed by any other connection are detected with PRAGMA data_version.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = None
+        self._data_version = None
+
+    def _connect(self):
+        if self._db is None:
+            # Loaded on the caller's thread first, then polled by the watcher
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS documents (id TEXT NOT NULL, category TEXT NOT NULL, "
+                "title TEXT, content TEXT, keywords TEXT, PRIMARY KEY (category, id))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _current_data_version(self):
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def changed(self):
+        return self._current_data_version() != self._data_version
+
+    def load(self):
+        data_version = self._current_data_version()
+        knowledge_base = {}
+        rows = self._connect().execute(
+            "SELECT category, id, title, content, keywords FROM documents ORDER BY category, rowid"
+        )
+        for category, doc_id, title, content, keywords in rows:
+            keywords = keywords or ""
+            if keywords.lstrip().startswith("["):
+                keywords = json.loads(keywords)
+            else:
+                keywords = [keyword.strip() for keyword in keywords.split(",") if keyword.strip()]
+            knowledge_base.setdefault(category, []).append(
+                {"id": doc_id, "title": title or doc_id, "content": content or "", "keywords": keywords}
+            )
+        self._data_version = data_version
+        return knowledge_base
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def open_store(path):
+    """Store for a path: a directory, a SQLite database, or a JSON/YAML file"""
+    if os.path.isdir(path):
+        return DirectoryStore(path)
+    if path.endswith(SQLITE_EXTENSIONS):
+        return SqliteStore(path)
+    return FileStore(path)
+
+
+def load_knowledge_base(path):
+    store = open_store(path)
+    try:
+        return store.load()
+    finally:
+        store.close()
+
+
+def export_knowledge_base(knowledge_base, path):
+    """Write a knowledge base into a directory or SQLite store"""
+    if path.endswith(SQLITE_EXTENSIONS):
+        store = SqliteStore(path)
+        db = store._connect()
+        with db:
+            for category, docs in knowledge_base.items():
+                db.executemany(
+                    "INSERT OR REPLACE INTO documents (id, category, title, content, keywords) VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (key, category, doc.get("title", ""), doc.get("content", ""),
+                         json.dumps(doc.get("keywords", []), ensure_ascii=False))
+                        for key, doc in zip(doc_keys(docs), docs)
+                    ]
+                )
+        store.close()
+        return
+    for category, docs in knowledge_base.items():
+        directory = os.path.join(path, category)
+        os.makedirs(directory, exist_ok=True)
+        # The ordinal prefix keeps the knowledge base order through the sorted listing
+        width = max(3, len(str(len(docs))))
+        for position, (key, doc) in enumerate(zip(doc_keys(docs), docs), start=1):
+            name = re.sub(r"[^a-z0-9]+", "-", key.lower()).strip("-") or "doc"
+            with open(os.path.join(directory, f"{position:0{width}d}-{name}.json"), "w", encoding="utf-8") as file:
+                json.dump(doc, file, indent=2, ensure_ascii=False)
+
+# ------------------------------------------------
+# Hot-reloaded knowledge base
+# ------------------------------------------------
+class LiveKnowledgeBase:
+    """The current index for a store, kept up to date by a polling thread.
+
+    Each change is applied as a diff (KnowledgeBaseIndex.apply) and the new
+    index replaces `index` in a single assignment, so tickets in flight keep
+    searching the version they started with and traffic never pauses. A
+    store that fails to load (e.g. a file caught mid-write) keeps the
+    current version until the next poll.
+    """
+
+    def __init__(self, store, poll_interval=5.0):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.index = KnowledgeBaseIndex(store.load())
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        if poll_interval:
+            self._thread = threading.Thread(target=self._watch, name="kb-watcher", daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        """Apply any pending store changes; True if a new version was swapped in"""
+        with self._lock:
+            if not self.store.changed():
+                return False
+            started = time.perf_counter()
+            updated, changes = self.index.apply(self.store.load())
+            previous = self.index.version
+            # A reorder keeps the version but changes the fallback and ties, so
+            # the new index is kept even when it is not counted as a reload
+            self.index = updated
+            if updated.version == previous:
+                return False
+        logger.info(
+            f"Knowledge base updated {previous} -> {updated.version} in {time.perf_counter() - started:.3f}s "
+            f"({changes['added']} added, {changes['changed']} changed, {changes['removed']} removed)"
+        )
+        if metrics.enabled():
+            metrics.KB_RELOADS.inc(result="applied")
+            for change, count in changes.items():
+                if count:
+                    metrics.KB_DOC_CHANGES.inc(count, change=change)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Knowledge base reload failed, keeping version {self.index.version}: {e}")
+                if metrics.enabled():
+                    metrics.KB_RELOADS.inc(result="failed")
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.store.close()
+
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+
+def get_knowledge_base():
+    """Load the knowledge base once per process and watch it for changes.
+
+    KNOWLEDGE_BASE_PATH points at a JSON/YAML file, a directory of
+    documents or a SQLite database; KB_POLL_INTERVAL is the seconds between
+    change checks (default 5, 0 loads once and never reloads).
+    """
+    global _knowledge_base
+    if _knowledge_base is None:
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                path = os.getenv("KNOWLEDGE_BASE_PATH", DEFAULT_KB_PATH)
+                _knowledge_base = LiveKnowledgeBase(
+                    open_store(path), poll_interval=float(os.getenv("KB_POLL_INTERVAL", "5"))
+                )
+                index = _knowledge_base.index
+                logger.info(
+                    f"Loaded knowledge base from {path}: "
+                    f"{sum(len(category.keys) for category in index.categories.values())} documents, "
+                    f"version {index.version}"
+                )
+    return _knowledge_base
+
+
+def get_index():
+    """The current version of the knowledge base index"""
+    return get_knowledge_base().index
+
+
+RETRIEVER_BACKENDS = ("bm25", "embedding")
+
+
+def get_retriever(backend=None):
+    """Return the retriever for a backend name ("bm25" or "embedding").
+
+    Defaults to the RETRIEVER_BACKEND environment variable, then "bm25".
+    Both retrievers expose `search(category, text, k=3, fallback=2)` and the
+    `version` of the knowledge base they search.
+    """
+    backend = (backend or os.getenv("RETRIEVER_BACKEND", "bm25")).strip().lower()
+    if backend == "bm25":
+        return get_index()
+    if backend == "embedding":
+        from embeddings import get_embedding_index
+
+        return get_embedding_index()
+    raise ValueError(f"Unknown retriever backend '{backend}', expected one of {RETRIEVER_BACKENDS}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) != 3:
+        print("Usage: python src/knowledge_base.py SOURCE DEST (DEST: a directory or a .sqlite file)")
+        sys.exit(1)
+    exported = load_knowledge_base(sys.argv[1])
+    export_knowledge_base(exported, sys.argv[2])
+    print(f"Exported {sum(len(docs) for docs in exported.values())} documents to {sys.argv[2]}")
@@ -0,0 +1,245 @@
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# ------------------------------------------------
+# Process-wide model registry
+# ------------------------------------------------
+# Chat clients are expensive to build (auth, transport and connection setup),
+# so one client is kept per (model, temperature) and shared by every node,
+# thread and event loop in the process. The underlying Gemini client keeps
+# its HTTP connections alive between calls, so reusing the instance also
+# reuses the pooled connections.
+_models = {}
+_models_lock = threading.Lock()
+_model_factory = None
+
+
+def _default_factory(model, temperature):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY not found in .env file")
+
+    from call_scheduler import scheduler_enabled
+
+    options = {}
+    if scheduler_enabled():
+        # Let 429s and timeouts reach the call scheduler instead of being
+        # retried (invisibly to its concurrency limit) inside the client
+        options = {"max_retries": 0, "timeout": float(os.getenv("LLM_TIMEOUT", "60"))}
+    return ChatGoogleGenerativeAI(
+        model=model,
+        temperature=temperature,
+        google_api_key=api_key,
+        **options
+    )
+
+
+def set_model_factory(factory):
+    """Replace how clients are built, e.g. with a local fake for tests.
+
+    `factory(model, temperature)` must return an object with `invoke(prompt)`.
+    Passing None restores the Gemini factory. Cached clients are dropped.
+    """
+    global _model_factory
+    with _models_lock:
+        _model_factory = factory
+        _models.clear()
+
+
+def clear_models():
+    with _models_lock:
+        _models.clear()
+
+
+def get_model(model=DEFAULT_MODEL, temperature=0):
+    """Return the shared client for (model, temperature), building it once"""
+    key = (model, temperature)
+    client = _models.get(key)
+    if client is not None:
+        return client
+
+    with _models_lock:
+        client = _models.get(key)
+        if client is None:
+            factory = _model_factory or _default_factory
+            logger.info(f"Creating shared LLM client for model={model}, temperature={temperature}")
+            client = factory(model, temperature)
+            _models[key] = client
+    return client
+
+
+def resolve_model(config=None, temperature=0):
+    """Pick the client for a node call.
+
+    A client handed in through `config["configurable"]["llm"]` wins; otherwise
+    `config["configurable"]["model"]` (or the default model) is looked up in
+    the registry.
+    """
+    configurable = (config or {}).get("configurable", {})
+    client = configurable.get("llm")
+    if client is not None:
+        return client
+    return get_model(configurable.get("model", DEFAULT_MODEL), temperature)
+
+
+def _model_name(client, config):
+    configurable = (config or {}).get("configurable", {})
+    if configurable.get("llm") is not None:
+        return getattr(client, "model", type(client).__name__)
+    return configurable.get("model", DEFAULT_MODEL)
+
+
+def _resolve_cache(config):
+    configurable = (config or {}).get("configurable", {})
+    if "cache" in configurable:
+        # An explicit ResponseCache, or None/False to bypass caching
+        return configurable["cache"] or None
+    from llm_cache import get_response_cache
+
+    return get_response_cache()
+
+
+def _resolve_scheduler(client, config):
+    configurable = (config or {}).get("configurable", {})
+    if "scheduler" in configurable:
+        # An explicit CallScheduler, or None/False to call the model directly
+        return configurable["scheduler"] or None
+    from call_scheduler import get_scheduler
+
+    return get_scheduler(_model_name(client, config))
+
+
+def structured_output_enabled(config=None):
+    configurable = (config or {}).get("configurable", {})
+    if "structured_output" in configurable:
+        return bool(configurable["structured_output"])
+    return os.getenv("STRUCTURED_OUTPUT", "on").strip().lower() not in ("0", "off", "false", "no")
+
+
+def _call(client, prompt, schema=None):
+    # Structured-output mode: Gemini constrains the answer to the JSON schema
+    kwargs = {"response_mime_type": "application/json", "response_schema": schema} if schema else {}
+    if not metrics.enabled():
+        return client.invoke(prompt, **kwargs).content.strip()
+
+    started = time.perf_counter()
+    response = client.invoke(prompt, **kwargs)
+    metrics.LLM_LATENCY.observe(time.perf_counter() - started)
+    text = response.content.strip()
+
+    usage = getattr(response, "usage_metadata", None) or {}
+    metrics.LLM_PROMPT_TOKENS.observe(usage.get("input_tokens") or metrics.estimate_tokens(prompt))
+    metrics.LLM_RESPONSE_TOKENS.observe(usage.get("output_tokens") or metrics.estimate_tokens(text))
+    return text
+
+
+def _scheduled_call(client, prompt, schema, config):
+    scheduler = _resolve_scheduler(client, config)
+    if scheduler is None:
+        return _call(client, prompt, schema)
+    return scheduler.run(lambda: _call(client, prompt, schema))
+
+
+def response_cache_slot(prompt, config=None, temperature=0, schema=None):
+    """(cache, key) under which invoke_model caches this call, or (None, None) if it is not cached.
+
+    Lets callers that answer several prompts with one call (see
+    classify_batcher.py) share entries with the single-prompt calls.
+    """
+    cache = _resolve_cache(config) if temperature == 0 else None
+    if cache is None:
+        return None, None
+    if schema is not None and not structured_output_enabled(config):
+        schema = None
+    from llm_cache import cache_key
+
+    client = resolve_model(config, temperature)
+    return cache, cache_key(_model_name(client, config), temperature, prompt, schema)
+
+
+def invoke_model(prompt, config=None, temperature=0, schema=None):
+    """Send a prompt through the resolved client and return the stripped text.
+
+    With a JSON `schema` (and structured output enabled) the model is asked
+    for schema-conforming JSON; callers still validate what comes back. At
+    temperature 0 the answer is deterministic, so responses are served from
+    the response cache when one is configured. Calls that reach the model go
+    through the per-model call scheduler (rate/concurrency limits, timeouts,
+    retries and hedging, see call_scheduler.py).
+    """
+    client = resolve_model(config, temperature)
+    if schema is not None and not structured_output_enabled(config):
+        schema = None
+    cache, key = response_cache_slot(prompt, config, temperature, schema)
+    if cache is None:
+        return _scheduled_call(client, prompt, schema, config)
+
+    text = cache.get(key)
+    if metrics.enabled():
+        metrics.LLM_CACHE_LOOKUPS.inc(result="miss" if text is None else "hit")
+    if text is None:
+        text = _scheduled_call(client, prompt, schema, config)
+        cache.set(key, text)
+    return text
+
+
+def _chunk_text(chunk):
+    content = chunk.content
+    if isinstance(content, str):
+        return content
+    # Some providers stream content as a list of parts
+    return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+
+
+def stream_model(prompt, config=None, temperature=0):
+    """Yield the answer to `prompt` in chunks as the model produces them.
+
+    A cached answer is yielded in one piece. The full text is cached only if
+    the stream was read to the end, so drafts abandoned part-way (by closing
+    the generator) are never served again.
+    """
+    client = resolve_model(config, temperature)
+    cache = _resolve_cache(config) if temperature == 0 else None
+    key = None
+    if cache is not None:
+        from llm_cache import cache_key
+
+        key = cache_key(_model_name(client, config), temperature, prompt)
+        text = cache.get(key)
+        if metrics.enabled():
+            metrics.LLM_CACHE_LOOKUPS.inc(result="miss" if text is None else "hit")
+        if text is not None:
+            yield text
+            return
+
+    scheduler = _resolve_scheduler(client, config)
+    chunks = []
+    started = time.perf_counter()
+    # The scheduler retries a stream that fails before its first chunk
+    stream = scheduler.stream(lambda: client.stream(prompt)) if scheduler is not None else client.stream(prompt)
+    try:
+        for chunk in stream:
+            text = _chunk_text(chunk)
+            if not text:
+                continue
+            if not chunks and metrics.enabled():
+                metrics.LLM_FIRST_TOKEN.observe(time.perf_counter() - started)
+            chunks.append(text)
+            yield text
+    finally:
+        stream.close()
+    if metrics.enabled():
+        metrics.LLM_LATENCY.observe(time.perf_counter() - started)
+
+    if cache is not None:
+        cache.set(key, "".join(chunks).strip())
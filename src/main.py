@@ -1,32 +1,43 @@
+from __future__ import annotations
+
 from typing import TypedDict, Annotated
-from langgraph.graph import StateGraph
-from langgraph.graph.message import add_messages
+import operator
 import os
-from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
+import sys
+import threading
+import time
+from llm import invoke_model, stream_model
+from knowledge_base import get_retriever
+import metrics
+from parsing import REVIEW_SCHEMA, COMPOSE_SCHEMA, parse_review, parse_composed
+from fast_classifier import get_fast_classifier, get_threshold
+from escalation import get_escalation_writer, close_escalation_writer, escalation_row
+from draft_checks import DraftMonitor, get_max_draft_chars
+from prompts import build_draft_prompt, build_review_prompt, build_compose_prompt
+from classify_batcher import classify_one, get_classify_batcher
 import logging
 
+logger = logging.getLogger(__name__)
+
 # ------------------------------------------------
-# Load Gemini API key from .env
+# Lazily imported dependencies
 # ------------------------------------------------
-load_dotenv()
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# LangGraph and LangChain take about a second to import, so they are bound
+# here on the first build_app() call instead of at import time. Annotations
+# are postponed (see the __future__ import) and resolved by LangGraph once
+# these names are bound.
+StateGraph = None
+add_messages = None
+RunnableConfig = None
 
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found in .env file")
+def _load_graph_dependencies():
+    global StateGraph, add_messages, RunnableConfig
+    if StateGraph is None:
+        from langgraph.graph import StateGraph as state_graph
+        from langgraph.graph.message import add_messages as message_reducer
+        from langchain_core.runnables import RunnableConfig as runnable_config
 
-# ------------------------------------------------
-# Setup logging
-# ------------------------------------------------
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('support_agent.log'),
-        logging.StreamHandler()
-    ]
-)
-logger = logging.getLogger(__name__)
+        StateGraph, add_messages, RunnableConfig = state_graph, message_reducer, runnable_config
 
 # ------------------------------------------------
 # Define the state schema for LangGraph
@@ -36,35 +47,50 @@ class State(TypedDict):
     category: str
     context: str
     docs: list
+    doc_titles: list
+    kb_version: str
     draft: str
+    draft_check: str
+    draft_mode: str
+    self_score: float
     review_status: str
     review_feedback: str
     attempt: int
+    escalation_status: str
+    escalation_file: str
+    prompt_tokens_saved: Annotated[int, operator.add]
     messages: Annotated[list, add_messages]
 
 # ------------------------------------------------
 # 1. Ticket Classification Node
 # ------------------------------------------------
-def classify_ticket(state: State):
+def classify_ticket(state: State, config: RunnableConfig = None):
     ticket = state["ticket"]
     logger.info(f"Starting ticket classification for subject: {ticket.get('subject', '')}")
     
-    prompt = (
-        f"Classify the following support ticket into one of these categories: "
-        f"Billing, Technical, Security, General.\n"
-        f"Subject: {ticket.get('subject', '')}\n"
-        f"Description: {ticket.get('description', '')}\n"
-        f"Category:"
+    # Fast path: confident local classification skips the LLM round-trip
+    classifier = get_fast_classifier()
+    threshold = get_threshold(config)
+    category, confidence, source = classifier.classify(
+        f"{ticket.get('subject', '')} {ticket.get('description', '')}", threshold
     )
-
-    model = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0,
-        google_api_key=GEMINI_API_KEY
-    )
-
-    response = model.invoke(prompt)
-    result = response.content.strip().split("\n")[0]  # First line = category
+    if category and confidence >= threshold:
+        classifier.record(source)
+        if metrics.enabled():
+            metrics.CLASSIFICATIONS.inc(path=source)
+        logger.info(f"Ticket classified as: {category} (fast path: {source}, confidence {confidence:.2f})")
+        print(f"Classifying ticket: {ticket['subject']} -> {category}")
+        return {"category": category}
+    
+    # Concurrent tickets may share one multi-ticket call
+    batcher = get_classify_batcher(config)
+    if batcher is not None:
+        result = batcher.classify(ticket, config)
+    else:
+        result = classify_one(ticket, config)
+    classifier.record("llm")
+    if metrics.enabled():
+        metrics.CLASSIFICATIONS.inc(path="llm")
     logger.info(f"Ticket classified as: {result}")
     print(f"Classifying ticket: {ticket['subject']} -> {result}")
 
@@ -73,190 +99,187 @@ def classify_ticket(state: State):
 # ------------------------------------------------
 # 2. Retrieval Node
 # ------------------------------------------------
-def retrieve_context(state: State):
+def retrieve_context(state: State, config: RunnableConfig = None):
     category = state["category"].strip().lower()
     subject = state["ticket"].get("subject", "")
     description = state["ticket"].get("description", "")
     
     logger.info(f"Retrieving context for category: {category}")
     
-    # Enhanced knowledge base with more comprehensive information
-    knowledge_base = {
-        "billing": [
-            {
-                "title": "Payment History Access",
-                "content": "How to view your payment history and download invoices. Navigate to Account Settings > Billing > Payment History. You can filter by date range and download PDF invoices.",
-                "keywords": ["payment", "invoice", "billing", "history", "download"]
-            },
-            {
-                "title": "Refund Policy",
-                "content": "Our refund policy allows for full refunds within 30 days of purchase. For disputes, contact billing support with your order number and reason for refund request.",
-                "keywords": ["refund", "policy", "dispute", "30 days", "order"]
-            },
-            {
-                "title": "Payment Methods",
-                "content": "We accept Visa, MasterCard, American Express, PayPal, and bank transfers. Update payment methods in Account Settings > Billing > Payment Methods.",
-                "keywords": ["credit card", "paypal", "bank transfer", "payment method"]
-            },
-            {
-                "title": "Billing Support Contact",
-                "content": "For billing inquiries, contact us at billing@company.com or call 1-800-BILLING. Include your account number for faster service.",
-                "keywords": ["contact", "email", "phone", "support", "billing"]
-            }
-        ],
-        "technical": [
-            {
-                "title": "App Troubleshooting",
-                "content": "If the app crashes, try clearing cache, restarting the device, or reinstalling. Check system requirements: iOS 13+ or Android 8+. Common issues include network connectivity and storage space.",
-                "keywords": ["crash", "troubleshoot", "cache", "restart", "reinstall", "system requirements"]
-            },
-            {
-                "title": "App Updates",
-                "content": "Enable automatic updates in your device settings. Manual updates available in App Store/Google Play. Latest version includes bug fixes and performance improvements.",
-                "keywords": ["update", "automatic", "manual", "app store", "google play", "version"]
-            },
-            {
-                "title": "Network Issues",
-                "content": "Check your internet connection and firewall settings. Try switching between WiFi and mobile data. VPN users may need to whitelist our servers.",
-                "keywords": ["network", "internet", "firewall", "wifi", "mobile data", "vpn"]
-            },
-            {
-                "title": "Technical Support Contact",
-                "content": "Technical support available 24/7 at tech@company.com or 1-800-TECH. Include device model, OS version, and error messages for faster resolution.",
-                "keywords": ["support", "24/7", "email", "phone", "device", "error"]
-            }
-        ],
-        "security": [
-            {
-                "title": "Password Reset",
-                "content": "Reset password via login page > Forgot Password. Enter email address, check spam folder for reset link. Create strong password with 8+ characters, uppercase, lowercase, numbers, symbols.",
-                "keywords": ["password", "reset", "forgot", "email", "strong", "security"]
-            },
-            {
-                "title": "Two-Factor Authentication",
-                "content": "Enable 2FA in Account Settings > Security > Two-Factor. Use authenticator app or SMS. Backup codes available for account recovery. Required for admin accounts.",
-                "keywords": ["2fa", "two-factor", "authenticator", "sms", "backup codes", "admin"]
-            },
-            {
-                "title": "Account Security",
-                "content": "Regular security audits, suspicious activity monitoring, login attempt limits. Report suspicious activity immediately. Never share credentials or click suspicious links.",
-                "keywords": ["security", "audit", "monitoring", "suspicious", "credentials", "phishing"]
-            },
-            {
-                "title": "Security Support Contact",
-                "content": "Security team available at security@company.com or 1-800-SECURE. For urgent security issues, use emergency hotline. Include incident details and timestamps.",
-                "keywords": ["security", "emergency", "hotline", "incident", "urgent", "timeline"]
-            }
-        ],
-        "general": [
-            {
-                "title": "Account Management",
-                "content": "Update profile information in Account Settings. Change email, phone, or address. Download account data or request deletion per GDPR compliance.",
-                "keywords": ["account", "profile", "settings", "gdpr", "data", "deletion"]
-            },
-            {
-                "title": "Feature Requests",
-                "content": "Submit feature requests via feedback form or email. Include use case, expected benefit, and priority level. Community voting determines development roadmap.",
-                "keywords": ["feature", "request", "feedback", "roadmap", "community", "voting"]
-            },
-            {
-                "title": "General Support Contact",
-                "content": "General inquiries at support@company.com or 1-800-SUPPORT. Business hours: Mon-Fri 9AM-6PM EST. Include account number and detailed description.",
-                "keywords": ["support", "business hours", "account number", "description", "general"]
-            }
-        ]
-    }
-    
-    # Get relevant documents for the category
-    category_docs = knowledge_base.get(category, [])
-    
-    # Enhanced semantic search using keyword matching and content relevance
-    relevant_docs = []
-    search_terms = f"{subject} {description}".lower().split()
-    
-    for doc in category_docs:
-        # Calculate relevance score based on keyword matches
-        keyword_matches = sum(1 for term in search_terms if term in doc["keywords"])
-        content_matches = sum(1 for term in search_terms if term in doc["content"].lower())
-        
-        # Higher score for more relevant documents
-        relevance_score = keyword_matches * 2 + content_matches
-        
-        if relevance_score > 0:
-            relevant_docs.append({
-                "doc": doc,
-                "score": relevance_score
-            })
+    # Score the category's documents against the ticket text with the
+    # configured backend (falls back to the first 2 docs if none match).
+    # The retriever is one knowledge base version, even if a reload lands now
+    backend = (config or {}).get("configurable", {}).get("retriever")
+    retriever = get_retriever(backend)
+    top_docs = retriever.search(category, f"{subject} {description}", k=3)
     
-    # Sort by relevance score and take top 3 most relevant
-    relevant_docs.sort(key=lambda x: x["score"], reverse=True)
-    top_docs = [item["doc"] for item in relevant_docs[:3]]
-    
-    # If no relevant docs found, provide category-specific general information
-    if not top_docs:
-        top_docs = category_docs[:2]  # Take first 2 docs from category
-    
-    # Extract content and create context summary
+    # The docs themselves travel in "docs"; context only summarizes them
     doc_contents = [doc["content"] for doc in top_docs]
-    context = f"Retrieved {len(top_docs)} relevant documents for category '{category}': {'; '.join(doc_contents)}"
+    doc_titles = [doc["title"] for doc in top_docs]
+    context = f"Retrieved {len(top_docs)} documents for category '{category}': {', '.join(doc_titles)}"
     
-    logger.info(f"Retrieved {len(top_docs)} relevant documents")
+    logger.info(f"Retrieved {len(top_docs)} relevant documents (knowledge base {retriever.version})")
     
     return {
         "docs": doc_contents,
         "context": context,
-        "doc_titles": [doc["title"] for doc in top_docs]
+        "doc_titles": doc_titles,
+        "kb_version": retriever.version
     }
 
 # ------------------------------------------------
 # 3. Draft Generation Node
 # ------------------------------------------------
-def generate_draft(state: State):
+def streaming_enabled(config=None):
+    configurable = (config or {}).get("configurable", {})
+    if "stream_draft" in configurable:
+        return bool(configurable["stream_draft"])
+    return os.getenv("STREAM_DRAFT", "off").strip().lower() in ("1", "on", "true", "yes")
+
+def _stream_draft(prompt, docs, attempt, config):
+    """Stream the draft to the caller, stopping as soon as a local check fails"""
+    from langgraph.config import get_stream_writer
+
+    # No-op unless the graph runs with stream_mode="custom"
+    writer = get_stream_writer()
+    monitor = DraftMonitor(docs, max_chars=get_max_draft_chars(config))
+    chunks = stream_model(prompt, config)
+    problem = None
+    try:
+        for chunk in chunks:
+            writer({"node": "draft", "attempt": attempt, "token": chunk})
+            problem = monitor.feed(chunk)
+            if problem:
+                break
+    finally:
+        # Closing the stream abandons the rest of the generation
+        chunks.close()
+    return monitor.text.strip(), problem or monitor.finish()
+
+def _current_attempt(state):
+    attempt = state.get("attempt", 1)
+    # Coming back from a rejected review means this is a retry
+    if state.get("review_status") == "rejected":
+        attempt += 1
+        logger.info(f"Retry attempt detected, incrementing to attempt {attempt}")
+        if metrics.enabled():
+            metrics.RETRIES.inc()
+    return attempt
+
+def generate_draft(state: State, config: RunnableConfig = None):
     ticket = state["ticket"]
     category = state["category"]
     docs = state["docs"]
-    attempt = state.get("attempt", 1)
+    attempt = _current_attempt(state)
     feedback = state.get("review_feedback", "")
     
     logger.info(f"Generating draft response (Attempt {attempt}) for category: {category}")
     
-    # If this is a retry, increment the attempt counter
-    if feedback and attempt == 1:
-        attempt = 2
-        logger.info(f"Retry attempt detected, incrementing to attempt {attempt}")
-    
-    prompt = (
-        "You are a professional support agent. Read the support ticket below and the relevant information provided. "
-        "Draft a clear, empathetic, and actionable response for the customer. "
-        "Directly address the user's issue, reference the relevant info, and provide step-by-step guidance or next actions. "
-        "If the issue is security-related, advise on immediate steps to protect the account. "
-        "If billing, explain refund/dispute process. "
-        "If technical, offer troubleshooting steps. "
-        "If general, answer the inquiry clearly. "
-        "Do not make promises you cannot keep.\n"
-        f"Category: {category}\n"
-        f"Subject: {ticket.get('subject', '')}\n"
-        f"Description: {ticket.get('description', '')}\n"
-        f"Relevant Info: {'; '.join(docs)}\n"
-        f"Previous Reviewer Feedback: {feedback}\n"
-        f"Attempt: {attempt}\n"
-        "\nCustomer Response:"
-    )
-    model = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0,
-        google_api_key=GEMINI_API_KEY
-    )
-    response = model.invoke(prompt)
-    draft = response.content.strip()
-    logger.info(f"Draft response generated successfully (Attempt {attempt})")
+    prompt, saved = build_draft_prompt(ticket, category, docs, feedback, attempt, config)
+    if not streaming_enabled(config):
+        draft = invoke_model(prompt, config)
+        logger.info(f"Draft response generated successfully (Attempt {attempt})")
+        print(f"Drafted response (Attempt {attempt}): {draft}")
+        return {"draft": draft, "attempt": attempt, "draft_check": "", "draft_mode": "separate", "prompt_tokens_saved": saved}
+
+    draft, problem = _stream_draft(prompt, docs, attempt, config)
+    if problem:
+        # Treated as a rejected review, so the retry/escalation path is unchanged
+        logger.info(f"Draft failed local checks (Attempt {attempt}): {problem}")
+        print(f"Draft stopped by local checks (Attempt {attempt}): {problem}")
+        if metrics.enabled():
+            metrics.DRAFT_ABORTS.inc()
+        return {
+            "draft": draft,
+            "attempt": attempt,
+            "draft_check": problem,
+            "draft_mode": "separate",
+            "review_status": "rejected",
+            "review_feedback": problem,
+            "prompt_tokens_saved": saved
+        }
+    logger.info(f"Draft response streamed successfully (Attempt {attempt})")
     print(f"Drafted response (Attempt {attempt}): {draft}")
-    return {"draft": draft, "attempt": attempt}
+    return {"draft": draft, "attempt": attempt, "draft_check": "", "draft_mode": "separate", "prompt_tokens_saved": saved}
+
+# ------------------------------------------------
+# 3b. Combined Draft + Self-Review Node
+# ------------------------------------------------
+DEFAULT_SELF_REVIEW_MIN_SCORE = 0.8
+
+def _category_set(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return {str(item).strip().lower() for item in value if str(item).strip()}
+
+def get_draft_mode(category, config=None):
+    """"combined" (one draft + self-review call) or "separate" (draft, then review).
+
+    configurable["draft_modes"] maps categories (or "*") to a mode; otherwise
+    $COMBINED_DRAFT_CATEGORIES lists the categories (or "*") that use the
+    combined call. Everything else keeps the separate review.
+    """
+    category = category.strip().lower()
+    modes = (config or {}).get("configurable", {}).get("draft_modes")
+    if modes:
+        # Keys are matched like $COMBINED_DRAFT_CATEGORIES: trimmed and case-insensitive
+        modes = {str(key).strip().lower(): mode for key, mode in modes.items()}
+        return modes.get(category, modes.get("*", "separate"))
+    combined = _category_set(os.getenv("COMBINED_DRAFT_CATEGORIES", ""))
+    return "combined" if "*" in combined or category in combined else "separate"
+
+def review_required(category, config=None):
+    """High-risk categories always get the separate LLM review"""
+    configurable = (config or {}).get("configurable", {})
+    value = configurable.get("review_required_categories", os.getenv("REVIEW_REQUIRED_CATEGORIES", "Security"))
+    return category.lower() in _category_set(value)
+
+def get_self_review_min_score(config=None):
+    configurable = (config or {}).get("configurable", {})
+    value = configurable.get("self_review_min_score")
+    if value is None:
+        value = os.getenv("SELF_REVIEW_MIN_SCORE", DEFAULT_SELF_REVIEW_MIN_SCORE)
+    return float(value)
+
+def compose_draft(state: State, config: RunnableConfig = None):
+    """Draft and self-review in one structured call; risky or doubtful drafts still go to review"""
+    ticket = state["ticket"]
+    category = state["category"]
+    docs = state["docs"]
+    attempt = _current_attempt(state)
+    feedback = state.get("review_feedback", "")
+
+    logger.info(f"Composing self-reviewed draft (Attempt {attempt}) for category: {category}")
+
+    prompt, saved = build_compose_prompt(ticket, category, docs, feedback, attempt, config)
+    draft, score, issues = parse_composed(invoke_model(prompt, config, schema=COMPOSE_SCHEMA))
+    print(f"Drafted response (Attempt {attempt}, self-score {score:.2f}): {draft}")
+    update = {
+        "draft": draft,
+        "attempt": attempt,
+        "draft_check": "",
+        "draft_mode": "combined",
+        "self_score": score,
+        "prompt_tokens_saved": saved
+    }
+
+    if review_required(category, config) or score < get_self_review_min_score(config):
+        logger.info(f"Combined draft sent to review (Attempt {attempt}, self-score {score:.2f}): {issues[:100]}")
+        if metrics.enabled():
+            metrics.SELF_REVIEWS.inc(result="sent_to_review")
+        return update
+
+    logger.info(f"Combined draft self-approved on attempt {attempt} (self-score {score:.2f})")
+    if metrics.enabled():
+        metrics.SELF_REVIEWS.inc(result="self_approved")
+    update["review_status"] = "approved"
+    update["review_feedback"] = issues or f"Self-review passed (score {score:.2f})"
+    return update
 
 # ------------------------------------------------
 # 4. Review Node (LLM-powered)
 # ------------------------------------------------
-def review_draft(state: State):
+def review_draft(state: State, config: RunnableConfig = None):
     ticket = state["ticket"]
     category = state["category"]
     docs = state["docs"]
@@ -265,45 +288,23 @@ def review_draft(state: State):
     
     logger.info(f"Reviewing draft response (Attempt {attempt}) for category: {category}")
     
-    prompt = (
-        "You are a support QA reviewer. Read the support ticket, relevant info, and the draft response below. "
-        "Evaluate if the response is accurate, helpful, and compliant with support guidelines. "
-        "If approved, reply with 'approved' and a short comment. If rejected, reply with 'rejected' and specific feedback for revision.\n"
-        f"Category: {category}\n"
-        f"Subject: {ticket.get('subject', '')}\n"
-        f"Description: {ticket.get('description', '')}\n"
-        f"Relevant Info: {'; '.join(docs)}\n"
-        f"Draft Response: {draft}\n"
-        f"Attempt: {attempt}\n"
-        "\nReview Result:"
-    )
-    model = ChatGoogleGenerativeAI(
-        model="gemini-2.0-flash",
-        temperature=0,
-        google_api_key=GEMINI_API_KEY
-    )
-    response = model.invoke(prompt)
-    review_text = response.content.strip().lower()
-    if "approved" in review_text:
-        status = "approved"
-        feedback = review_text
+    prompt, saved = build_review_prompt(ticket, category, docs, draft, attempt, config)
+    status, feedback = parse_review(invoke_model(prompt, config, schema=REVIEW_SCHEMA))
+    if metrics.enabled():
+        metrics.REVIEWS.inc(mode=state.get("draft_mode") or "separate", status=status)
+    if status == "approved":
         logger.info(f"Draft approved on attempt {attempt}")
     else:
-        status = "rejected"
-        feedback = review_text
         logger.info(f"Draft rejected on attempt {attempt}. Feedback: {feedback[:100]}...")
     
     print(f"Review result (Attempt {attempt}): {status}\nFeedback: {feedback}")
-    return {"review_status": status, "review_feedback": feedback}
+    return {"review_status": status, "review_feedback": feedback, "prompt_tokens_saved": saved}
 
 # ------------------------------------------------
 # 5. Escalation Node
 # ------------------------------------------------
 def escalate_ticket(state: State):
-    """Log failed tickets to CSV for human review"""
-    import csv
-    from datetime import datetime
-    
+    """Queue failed tickets for human review via the background escalation writer"""
     ticket = state["ticket"]
     category = state["category"]
     docs = state["docs"]
@@ -311,158 +312,612 @@ def escalate_ticket(state: State):
     review_feedback = state.get("review_feedback", "")
     attempt = state.get("attempt", 1)
     
-    escalation_data = {
-        "timestamp": datetime.now().isoformat(),
-        "subject": ticket.get("subject", ""),
-        "description": ticket.get("description", ""),
-        "category": category,
-        "attempts": attempt,
-        "final_draft": draft,
-        "reviewer_feedback": review_feedback,
-        "retrieved_context": "; ".join(docs)
-    }
-    
-    # Write to CSV file
-    csv_file = "escalation_log.csv"
-    file_exists = os.path.exists(csv_file)
-    
-    with open(csv_file, mode='a', newline='', encoding='utf-8') as file:
-        fieldnames = escalation_data.keys()
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        
-        if not file_exists:
-            writer.writeheader()
-        
-        writer.writerow(escalation_data)
+    writer = get_escalation_writer()
+    writer.submit(escalation_row(
+        ticket, category, attempt, draft, review_feedback, docs, kb_version=state.get("kb_version", "")
+    ))
     
-    print(f"Ticket escalated to {csv_file} for human review")
-    logger.info(f"Ticket escalated to {csv_file}")
+    print(f"Ticket escalated to {writer.location} for human review")
+    logger.info(f"Ticket escalated to {writer.location}")
     
     return {
         "escalation_status": "logged",
-        "escalation_file": csv_file
+        "escalation_file": writer.location
     }
 
 # ------------------------------------------------
 # Build LangGraph Workflow
 # ------------------------------------------------
-graph = StateGraph(State)
-
-# Add nodes
-graph.add_node("classify", classify_ticket)
-graph.add_node("retrieve", retrieve_context)
-graph.add_node("draft", generate_draft)
-graph.add_node("review", review_draft)
-graph.add_node("escalate", escalate_ticket)
-
-# Add linear edges for the main flow
-graph.add_edge("classify", "retrieve")
-graph.add_edge("retrieve", "draft")
-graph.add_edge("draft", "review")
-
-# Add conditional edges for review outcomes
-def retry_condition(state: State):
-    return state["review_status"] == "rejected" and state.get("attempt", 1) < 2
-
-def success_condition(state: State):
-    return state["review_status"] == "approved"
-
-def escalation_condition(state: State):
-    return state["review_status"] == "rejected" and state.get("attempt", 1) >= 2
-
-# Add conditional edges with proper routing
-graph.add_conditional_edges(
-    "review",
-    {
-        "draft": retry_condition,      # Go back to draft if rejected and attempts < 2
-        "__end__": success_condition,  # End if approved
-        "escalate": escalation_condition  # Escalate if both attempts failed
+DEFAULT_MAX_ATTEMPTS = 2
+
+def get_max_attempts(config=None):
+    configurable = (config or {}).get("configurable", {})
+    return int(configurable.get("max_attempts") or os.getenv("MAX_ATTEMPTS", DEFAULT_MAX_ATTEMPTS))
+
+def get_checkpointer():
+    """SQLite saver when CHECKPOINT_DB is set (and installed), otherwise in-memory"""
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    db_path = os.getenv("CHECKPOINT_DB")
+    if not db_path:
+        return InMemorySaver()
+    try:
+        import sqlite3
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError:
+        logger.warning("CHECKPOINT_DB is set but langgraph-checkpoint-sqlite is not installed; using in-memory checkpoints")
+        return InMemorySaver()
+    return SqliteSaver(sqlite3.connect(db_path, check_same_thread=False))
+
+# Route review outcomes: retries go straight back to draft with the stored
+# category and docs, so classification and retrieval are never repeated
+def route_review(state: State, config: RunnableConfig = None):
+    if state["review_status"] == "approved":
+        return "__end__"
+    if state.get("attempt", 1) < get_max_attempts(config):
+        return route_drafting(state, config)
+    return "escalate"
+
+# Pick the draft node for the ticket's category (see get_draft_mode)
+def route_drafting(state: State, config: RunnableConfig = None):
+    return "compose" if get_draft_mode(state["category"], config) == "combined" else "draft"
+
+# Self-approved combined drafts finish here; the rest get the LLM review
+def route_compose(state: State, config: RunnableConfig = None):
+    return "__end__" if state.get("review_status") == "approved" else "review"
+
+# Drafts that failed the local streaming checks skip the LLM review
+def route_draft(state: State, config: RunnableConfig = None):
+    if state.get("draft_check"):
+        return route_review(state, config)
+    return "review"
+
+def build_app(config=None):
+    """Build and compile the support graph.
+
+    `config` may provide a "checkpointer"; by default get_checkpointer() picks
+    one from the environment. Heavy imports happen here, on first use.
+    """
+    _load_graph_dependencies()
+    config = config or {}
+
+    graph = StateGraph(State)
+
+    # Add nodes
+    graph.add_node("classify", metrics.instrument_node("classify", classify_ticket))
+    graph.add_node("retrieve", metrics.instrument_node("retrieve", retrieve_context))
+    graph.add_node("draft", metrics.instrument_node("draft", generate_draft))
+    graph.add_node("compose", metrics.instrument_node("compose", compose_draft))
+    graph.add_node("review", metrics.instrument_node("review", review_draft))
+    graph.add_node("escalate", metrics.instrument_node("escalate", escalate_ticket))
+
+    # Add linear edges for the main flow
+    graph.add_edge("classify", "retrieve")
+    graph.add_conditional_edges(
+        "retrieve",
+        route_drafting,
+        {
+            "draft": "draft",        # Draft, then a separate LLM review
+            "compose": "compose"     # One call drafts and self-reviews
+        }
+    )
+    graph.add_conditional_edges(
+        "draft",
+        route_draft,
+        {
+            "review": "review",      # Normal path: LLM review
+            "draft": "draft",        # Local checks failed, retry with their feedback
+            "compose": "compose",
+            "escalate": "escalate"   # Local checks failed on the last attempt
+        }
+    )
+
+    graph.add_conditional_edges(
+        "compose",
+        route_compose,
+        {
+            "review": "review",      # High-risk category or low self-score
+            "__end__": "__end__"     # Self-approved
+        }
+    )
+
+    graph.add_conditional_edges(
+        "review",
+        route_review,
+        {
+            "draft": "draft",        # Retry with reviewer feedback
+            "compose": "compose",    # Retry in combined mode
+            "__end__": "__end__",    # End if approved
+            "escalate": "escalate"   # Escalate once attempts are exhausted
+        }
+    )
+
+    # Add edge from escalate to end
+    graph.add_edge("escalate", "__end__")
+
+    # Set the entry point
+    graph.set_entry_point("classify")
+
+    # Compile the graph with a checkpointer so interrupted tickets can resume
+    checkpointer = config.get("checkpointer") or get_checkpointer()
+    return graph.compile(checkpointer=checkpointer)
+
+_app = None
+_app_lock = threading.Lock()
+
+def get_app():
+    """The process-wide compiled graph, built on first use"""
+    global _app
+    if _app is None:
+        with _app_lock:
+            if _app is None:
+                _app = build_app()
+    return _app
+
+def warm_up(config=None):
+    """Build the graph, fast classifier and retriever now rather than on the first ticket"""
+    get_app()
+    get_fast_classifier()
+    get_retriever((config or {}).get("configurable", {}).get("retriever"))
+
+def __getattr__(name):
+    # Keep `main.app` / `main.checkpointer` working without building at import
+    if name == "app":
+        return get_app()
+    if name == "checkpointer":
+        return get_app().checkpointer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# ------------------------------------------------
+# Ticket Processing
+# ------------------------------------------------
+def build_initial_state(ticket):
+    return {
+        "ticket": {
+            "subject": ticket["subject"],
+            "description": ticket["description"]
+        },
+        "category": "",
+        "context": "",
+        "docs": [],
+        "draft": "",
+        "draft_check": "",
+        "draft_mode": "",
+        "self_score": 0.0,
+        "review_status": "",
+        "review_feedback": "",
+        "attempt": 1,
+        "prompt_tokens_saved": 0,
+        "messages": []
     }
-)
 
-# Add edge from escalate to end
-graph.add_edge("escalate", "__end__")
+def build_ticket_config(config, thread_id, max_attempts=None):
+    configurable = dict((config or {}).get("configurable", {}))
+    configurable["thread_id"] = thread_id
+    if max_attempts is not None:
+        configurable["max_attempts"] = max_attempts
+    # Each retry is a draft + review step, so size the recursion limit to fit
+    recursion_limit = 2 * get_max_attempts({"configurable": configurable}) + 10
+    return {**(config or {}), "configurable": configurable, "recursion_limit": recursion_limit}
+
+def ticket_thread_id(ticket):
+    """Checkpoint thread for a ticket: its id plus a hash of its content.
+
+    Batch ids such as "line-1" repeat across files and runs, so the hash keeps
+    a different ticket with a reused id from resuming someone else's run.
+    Tickets without an id get a fresh UUID.
+    """
+    import hashlib
+    import uuid
+
+    if not ticket.get("id"):
+        return str(uuid.uuid4())
+    content = f"{ticket.get('subject', '')}\0{ticket.get('description', '')}"
+    return f"{ticket['id']}:{hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]}"
+
+def _start_ticket(ticket, config, max_attempts, thread_id=None):
+    thread_id = thread_id or ticket_thread_id(ticket)
+    return thread_id, build_ticket_config(config, thread_id, max_attempts), time.perf_counter()
+
+def checkpoints_durable():
+    """True unless checkpoints only live in this process's memory"""
+    from langgraph.checkpoint.memory import InMemorySaver
+
+    return not isinstance(get_app().checkpointer, InMemorySaver)
+
+def _discard_failed(thread_id):
+    """Drop a failed ticket's checkpoints unless they are durable.
+
+    In-memory checkpoints cannot be resumed from another process, so keeping
+    them would only grow memory over a long batch; SQLite ones stay for --resume.
+    """
+    if not checkpoints_durable():
+        get_app().checkpointer.delete_thread(thread_id)
+        logger.error(f"Ticket thread {thread_id} failed; its in-memory checkpoints were discarded")
+    else:
+        logger.error(f"Ticket thread {thread_id} failed; continue it with --resume {thread_id}")
+
+def _finish_ticket(result, thread_id, started):
+    if metrics.enabled():
+        outcome = "approved" if result.get("review_status") == "approved" else "escalated"
+        metrics.TICKETS.inc(outcome=outcome)
+        metrics.TICKET_LATENCY.observe(
+            time.perf_counter() - started, mode=result.get("draft_mode") or "separate", outcome=outcome
+        )
+
+    if result.get("review_status") == "approved":
+        print(f"✅ Response approved on attempt {result.get('attempt')}! Workflow completed successfully.")
+    else:
+        print(f"🚨 Response rejected on attempt {result.get('attempt')}. Escalated to human review.")
+
+    if result.get("prompt_tokens_saved"):
+        logger.info(f"Prompt compaction saved ~{result['prompt_tokens_saved']} tokens for ticket {thread_id}")
+
+    # Completed tickets no longer need their checkpoints
+    get_app().checkpointer.delete_thread(thread_id)
+    return result
+
+def _streaming_config(ticket_config):
+    configurable = dict(ticket_config["configurable"], stream_draft=True)
+    return {**ticket_config, "configurable": configurable}
+
+def process_ticket(ticket, max_attempts=None, config=None, on_token=None, thread_id=None):
+    """Run a ticket through the workflow, resuming from its checkpoint if one is pending.
 
-# Set the entry point
-graph.set_entry_point("classify")
+    Retries and escalation happen inside the graph. The checkpoint thread is
+    ticket_thread_id(ticket) unless `thread_id` is given, so re-running an
+    interrupted ticket continues at the node where it stopped. `config` is passed to the graph,
+    e.g. {"configurable": {"llm": model}} to hand the nodes a specific client.
+    With `on_token`, drafts are streamed and every chunk is passed to
+    on_token({"node", "attempt", "token"}) as it arrives.
+    """
+    thread_id, ticket_config, started = _start_ticket(ticket, config, max_attempts, thread_id)
 
-# Compile the graph
-app = graph.compile()
+    app = get_app()
+    pending = app.get_state(ticket_config).next
+    if pending:
+        logger.info(f"Resuming ticket {thread_id} at node(s): {', '.join(pending)}")
+        payload = None
+    else:
+        logger.info(f"Starting new ticket processing (thread {thread_id}): {ticket['subject']}")
+        payload = build_initial_state(ticket)
+
+    try:
+        if on_token is None:
+            result = app.invoke(payload, ticket_config)
+        else:
+            result = None
+            stream = app.stream(payload, _streaming_config(ticket_config), stream_mode=["custom", "values"])
+            for mode, chunk in stream:
+                if mode == "custom":
+                    on_token(chunk)
+                else:
+                    result = chunk
+    except Exception:
+        _discard_failed(thread_id)
+        raise
+
+    return _finish_ticket(result, thread_id, started)
+
+async def aprocess_ticket(ticket, max_attempts=None, config=None, on_token=None, thread_id=None):
+    """Async twin of process_ticket built on app.ainvoke / app.astream.
+
+    Needs an async-capable checkpointer; the in-memory default is one.
+    """
+    thread_id, ticket_config, started = _start_ticket(ticket, config, max_attempts, thread_id)
+
+    app = get_app()
+    pending = (await app.aget_state(ticket_config)).next
+    if pending:
+        logger.info(f"Resuming ticket {thread_id} at node(s): {', '.join(pending)}")
+        payload = None
+    else:
+        logger.info(f"Starting new ticket processing (thread {thread_id}): {ticket['subject']}")
+        payload = build_initial_state(ticket)
+
+    try:
+        if on_token is None:
+            result = await app.ainvoke(payload, ticket_config)
+        else:
+            result = None
+            stream = app.astream(payload, _streaming_config(ticket_config), stream_mode=["custom", "values"])
+            async for mode, chunk in stream:
+                if mode == "custom":
+                    on_token(chunk)
+                else:
+                    result = chunk
+    except Exception:
+        _discard_failed(thread_id)
+        raise
+
+    return _finish_ticket(result, thread_id, started)
+
+def _pending_thread(ticket_id):
+    """Most recent interrupted thread for a ticket id (or an exact thread id)"""
+    app = get_app()
+    if app.get_state(build_ticket_config(None, ticket_id)).next:
+        return ticket_id
+    latest = None
+    for checkpoint in app.checkpointer.list(None):
+        thread_id = checkpoint.config["configurable"]["thread_id"]
+        if thread_id.startswith(f"{ticket_id}:") and (latest is None or checkpoint.checkpoint["ts"] > latest[0]):
+            latest = (checkpoint.checkpoint["ts"], thread_id)
+    if latest and app.get_state(build_ticket_config(None, latest[1])).next:
+        return latest[1]
+    return None
+
+def resume_ticket(ticket_id, config=None, on_token=None):
+    """Continue an interrupted ticket from its last checkpoint"""
+    thread_id = _pending_thread(ticket_id)
+    if thread_id is None:
+        raise ValueError(f"No interrupted run found for ticket '{ticket_id}'")
+    ticket = get_app().get_state(build_ticket_config(config, thread_id)).values["ticket"]
+    return process_ticket(ticket, config=config, on_token=on_token, thread_id=thread_id)
 
 # ------------------------------------------------
 # Main Execution
 # ------------------------------------------------
-if __name__ == "__main__":
+def parse_args():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Support Ticket Resolution Agent")
+    parser.add_argument(
+        "--batch",
+        metavar="PATH",
+        help="Process tickets from a JSONL file ('-' for stdin) instead of prompting"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="PATH",
+        default="batch_results.jsonl",
+        help="Where to write batch results as JSONL ('-' for stdout)"
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=4,
+        help="Number of tickets in flight during a batch run"
+    )
+    parser.add_argument(
+        "--retriever",
+        choices=["bm25", "embedding"],
+        help="Retrieval backend (defaults to $RETRIEVER_BACKEND, then bm25)"
+    )
+    parser.add_argument(
+        "--max-attempts",
+        type=int,
+        help="Draft/review attempts before escalating (defaults to $MAX_ATTEMPTS, then 2)"
+    )
+    parser.add_argument(
+        "--resume",
+        metavar="TICKET_ID",
+        help="Resume an interrupted ticket from its checkpoint (needs CHECKPOINT_DB)"
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        help="Serve Prometheus metrics on http://127.0.0.1:PORT/metrics"
+    )
+    parser.add_argument(
+        "--metrics-json",
+        metavar="PATH",
+        help="Write collected metrics as JSON when the run finishes"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream draft tokens as they are generated and stop drafts that fail local checks early"
+    )
+    parser.add_argument(
+        "--queue",
+        metavar="PATH",
+        help="Durable SQLite work queue; --batch tickets are enqueued and worker processes drain it"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="Worker processes for --queue (defaults to the CPU count; 0 only enqueues)"
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="With --queue, keep workers polling for new tickets instead of exiting when drained"
+    )
+    args = parser.parse_args()
+    if args.queue and args.metrics_port:
+        # Tickets run in the worker processes, not in the one serving /metrics
+        parser.error("--metrics-port is not supported with --queue; use --metrics-json for the merged totals")
+    return args
+
+def setup_metrics(args):
+    if args.metrics_port or args.metrics_json:
+        metrics.enable()
+    if args.metrics_port:
+        metrics.start_metrics_server(args.metrics_port)
+
+def finish_metrics(args):
+    if not metrics.enabled():
+        return
+    logger.info(f"Metrics summary: {metrics.summary()}")
+    if args.metrics_json:
+        metrics.REGISTRY.dump_json(args.metrics_json)
+
+def build_run_config(args):
+    configurable = {}
+    if args.retriever:
+        configurable["retriever"] = args.retriever
+    if args.max_attempts:
+        configurable["max_attempts"] = args.max_attempts
+    if args.stream:
+        # Batch runs get the early local checks without printing tokens
+        configurable["stream_draft"] = True
+    return {"configurable": configurable}
+
+def progress_output(output_path):
+    """Send progress prints to stderr while results are written to stdout ("-")"""
+    import contextlib
+
+    if output_path == "-":
+        return contextlib.redirect_stdout(sys.stderr)
+    return contextlib.nullcontext()
+
+def run_batch_mode(args):
+    from functools import partial
+    from batch import run_batch, open_input, open_output
+
+    process = partial(process_ticket, config=build_run_config(args))
+    input_stream = open_input(args.batch)
+    output_stream = open_output(args.output)
+    to_stdout = output_stream is sys.stdout
+    try:
+        with progress_output(args.output):
+            stats = run_batch(process, input_stream, output_stream, concurrency=args.concurrency)
+            # Make sure every queued escalation is on disk before reporting
+            close_escalation_writer()
+            print(
+                f"Batch complete: {stats['processed']} processed, {stats['failed']} failed, "
+                f"{stats['invalid']} invalid -> {args.output}"
+            )
+    finally:
+        if input_stream is not sys.stdin:
+            input_stream.close()
+        if not to_stdout:
+            output_stream.close()
+
+    from llm_cache import get_response_cache
+
+    cache = get_response_cache()
+    if cache is not None:
+        logger.info(f"LLM response cache: {cache.stats()}")
+    logger.info(f"Classification paths: {get_fast_classifier().stats()}")
+
+    from call_scheduler import all_scheduler_stats
+
+    schedulers = all_scheduler_stats()
+    if schedulers:
+        logger.info(f"LLM call schedulers: {schedulers}")
+
+def run_queue_mode(args):
+    import json
+    from batch import iter_tickets, open_input, open_output
+    from work_queue import WorkQueue
+    from worker_pool import run_pool
+
+    work_queue = WorkQueue(args.queue)
+    try:
+        if args.batch:
+            input_stream = open_input(args.batch)
+            try:
+                tickets = []
+                for line_number, ticket, error in iter_tickets(input_stream):
+                    if error:
+                        logger.warning(f"Skipping line {line_number}: {error}")
+                    else:
+                        tickets.append(ticket)
+            finally:
+                if input_stream is not sys.stdin:
+                    input_stream.close()
+            with progress_output(args.output):
+                print(f"Enqueued {work_queue.enqueue_many(tickets)} ticket(s) -> {args.queue}")
+        if args.workers == 0:
+            return
+    finally:
+        work_queue.close()
+
+    stats = run_pool(
+        args.queue,
+        workers=args.workers,
+        config=build_run_config(args),
+        drain=not args.serve,
+        initializer=setup_environment,
+        collect_worker_metrics=metrics.enabled()
+    )
+
+    work_queue = WorkQueue(args.queue)
+    output_stream = open_output(args.output)
+    to_stdout = output_stream is sys.stdout
+    try:
+        for result in work_queue.iter_results():
+            output_stream.write(json.dumps(result, ensure_ascii=False) + "\n")
+    finally:
+        work_queue.close()
+        if not to_stdout:
+            output_stream.close()
+    with progress_output(args.output):
+        print(f"Queue drained: {stats['done']} done, {stats['dead']} dead-lettered -> {args.output}")
+
+def make_token_printer():
+    """Callback printing streamed draft chunks, with a header per attempt"""
+    current = {"attempt": None}
+
+    def print_token(event):
+        if current["attempt"] != event["attempt"]:
+            current["attempt"] = event["attempt"]
+            print(f"\n✍️  Streaming draft (Attempt {event['attempt']}): ", end="")
+        print(event["token"], end="", flush=True)
+    return print_token
+
+def setup_environment():
+    """Process-level setup that only the CLI should do: .env loading and logging"""
+    from dotenv import load_dotenv
+
+    # The Gemini key itself is checked when the first client is built (llm.py)
+    load_dotenv()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler('support_agent.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+def main():
+    args = parse_args()
+    setup_environment()
+    setup_metrics(args)
+    if args.queue:
+        run_queue_mode(args)
+        finish_metrics(args)
+        return
+    if args.batch:
+        run_batch_mode(args)
+        finish_metrics(args)
+        return
+
     print("=" * 60)
     print("Support Ticket Resolution Agent with Multi-Step Review Loop")
     print("=" * 60)
     print()
     
+    thread_id = None
     try:
-        # Get user input
-        subject = input("Enter ticket subject: ").strip()
-        description = input("Enter ticket description: ").strip()
-        
-        if not subject or not description:
-            print("❌ Error: Both subject and description are required.")
-            exit(1)
-        
-        # Initialize state
-        initial_state = {
-            "ticket": {
-                "subject": subject,
-                "description": description
-            },
-            "category": "",
-            "context": "",
-            "docs": [],
-            "draft": "",
-            "review_status": "",
-            "review_feedback": "",
-            "attempt": 1,
-            "messages": []
-        }
-        
-        logger.info(f"Starting new ticket processing: {subject}")
-        
-        # Run the complete workflow using pre-compiled graph
-        print("\n🚀 Processing ticket through LangGraph workflow...")
-        
-        # Execute the workflow with explicit retry handling
-        current_state = initial_state
-        max_attempts = 2
-        attempt = 1
-        
-        while attempt <= max_attempts:
-            print(f"\n🔄 Attempt {attempt} of {max_attempts}")
+        if args.resume:
+            print(f"\n🔁 Resuming ticket {args.resume} from its last checkpoint...")
+            result = resume_ticket(
+                args.resume,
+                config=build_run_config(args),
+                on_token=make_token_printer() if args.stream else None
+            )
+        else:
+            # Get user input
+            subject = input("Enter ticket subject: ").strip()
+            description = input("Enter ticket description: ").strip()
             
-            # Run the workflow up to the review step
-            if attempt == 1:
-                # First attempt: run through the entire workflow
-                result = app.invoke(current_state)
-            else:
-                # Retry: start from draft with feedback
-                retry_state = current_state.copy()
-                retry_state["attempt"] = attempt
-                retry_state["review_feedback"] = current_state.get("review_feedback", "")
-                
-                # Run from draft to review
-                result = app.invoke(retry_state)
+            if not subject or not description:
+                print("❌ Error: Both subject and description are required.")
+                exit(1)
             
-            # Check the result
-            if result.get("review_status") == "approved":
-                print("✅ Response approved! Workflow completed successfully.")
-                break
-            elif result.get("review_status") == "rejected" and attempt < max_attempts:
-                print(f"🔄 Response rejected on attempt {attempt}. Retrying with feedback...")
-                current_state = result
-                attempt += 1
-            else:
-                print(f"🚨 Response rejected on attempt {attempt}. Escalating to human review...")
-                # Manually trigger escalation
-                escalation_result = escalate_ticket(result)
-                result.update(escalation_result)
-                break
+            # Run the complete workflow using pre-compiled graph
+            ticket = {"subject": subject, "description": description}
+            thread_id = ticket_thread_id(ticket)
+            print(f"\n🚀 Processing ticket through LangGraph workflow (thread {thread_id})...")
+            result = process_ticket(
+                ticket,
+                config=build_run_config(args),
+                on_token=make_token_printer() if args.stream else None,
+                thread_id=thread_id
+            )
         
         # Display final results
         print("\n" + "=" * 60)
@@ -482,8 +937,15 @@ if __name__ == "__main__":
             print(f"📁 Escalation File: {result.get('escalation_file', 'N/A')}")
         
         logger.info("Ticket processing completed successfully")
+        finish_metrics(args)
         
     except Exception as e:
         logger.error(f"Error processing ticket: {str(e)}", exc_info=True)
         print(f"\n❌ Error processing ticket: {str(e)}")
+        if thread_id and checkpoints_durable():
+            print(f"Continue it with: python src/main.py --resume {thread_id}")
         print("Check the logs for more details.")
+
+
+if __name__ == "__main__":
+    main()
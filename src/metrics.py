@@ -0,0 +1,358 @@
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+RATIO_BUCKETS = (0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+
+# ------------------------------------------------
+# Metric types
+# ------------------------------------------------
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [(f"{self.name}{_format_labels(key)}", value) for key, value in self._values.items()]
+
+    def to_dict(self):
+        with self._lock:
+            return [{"labels": dict(key), "value": value} for key, value in self._values.items()]
+
+    def merge(self, items):
+        """Add values exported by to_dict() (e.g. from another process)"""
+        for item in items:
+            self.inc(item["value"], **item["labels"])
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., +Inf count, sum]
+        self._samples = None  # label key -> raw values, only while keep_samples is on
+        self._lock = threading.Lock()
+
+    def keep_samples(self, flag=True):
+        """Also keep raw observations so quantile() is exact (benchmarks)"""
+        with self._lock:
+            self._samples = {} if flag else None
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+            if self._samples is not None:
+                self._samples.setdefault(key, []).append(value)
+
+    def quantile(self, q, **labels):
+        """Exact from raw samples when kept, otherwise interpolated within buckets"""
+        key = _label_key(labels)
+        with self._lock:
+            if self._samples is not None and self._samples.get(key):
+                values = sorted(self._samples[key])
+                return values[min(len(values) - 1, int(q * len(values)))]
+            series = self._series.get(key)
+            if series is None:
+                return 0.0
+            counts = series[:-1]
+        rank = q * sum(counts)
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            if count and cumulative + count >= rank:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+    def samples(self):
+        lines = []
+        with self._lock:
+            for key, series in self._series.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series[:-1]):
+                    cumulative += count
+                    lines.append((f"{self.name}_bucket{_format_labels(key, [('le', bound)])}", cumulative))
+                lines.append((f"{self.name}_sum{_format_labels(key)}", round(series[-1], 6)))
+                lines.append((f"{self.name}_count{_format_labels(key)}", cumulative))
+        return lines
+
+    def to_dict(self):
+        with self._lock:
+            result = []
+            for key, series in self._series.items():
+                count = sum(series[:-1])
+                result.append({
+                    "labels": dict(key),
+                    "count": count,
+                    "sum": round(series[-1], 6),
+                    "mean": round(series[-1] / count, 6) if count else 0.0,
+                    "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], series[:-1])),
+                })
+            return result
+
+    def merge(self, items):
+        """Add series exported by to_dict(); raw samples are not carried over"""
+        names = [str(b) for b in self.buckets] + ["+Inf"]
+        with self._lock:
+            for item in items:
+                key = _label_key(item["labels"])
+                series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+                for index, name in enumerate(names):
+                    series[index] += item["buckets"].get(name, 0)
+                series[-1] += item["sum"]
+
+# ------------------------------------------------
+# Registry and exporters
+# ------------------------------------------------
+class MetricsRegistry:
+    def __init__(self):
+        self.enabled = os.getenv("METRICS", "off").strip().lower() in ("1", "on", "true", "yes")
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help_text):
+        return self._register(Counter(name, help_text))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, help_text, buckets))
+
+    def render_prometheus(self):
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name} {value}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """Drop every recorded value (used between benchmark runs)"""
+        for metric in list(self._metrics.values()):
+            with metric._lock:
+                if metric.kind == "counter":
+                    metric._values.clear()
+                else:
+                    metric._series.clear()
+                    if metric._samples is not None:
+                        metric._samples.clear()
+
+    def to_dict(self):
+        return {name: metric.to_dict() for name, metric in list(self._metrics.items())}
+
+    def merge(self, data):
+        """Fold in another registry's to_dict() output, e.g. a worker process's"""
+        for name, items in data.items():
+            metric = self._metrics.get(name)
+            if metric is not None:
+                metric.merge(items)
+
+    def dump_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+        logger.info(f"Metrics written to {path}")
+
+
+REGISTRY = MetricsRegistry()
+
+NODE_LATENCY = REGISTRY.histogram("support_node_duration_seconds", "Wall time per graph node call")
+NODE_ERRORS = REGISTRY.counter("support_node_errors_total", "Graph node calls that raised")
+LLM_LATENCY = REGISTRY.histogram("support_llm_call_duration_seconds", "Latency of LLM calls that reached the model")
+LLM_FIRST_TOKEN = REGISTRY.histogram("support_llm_first_token_seconds", "Time to first chunk of streamed LLM calls")
+LLM_PROMPT_TOKENS = REGISTRY.histogram("support_llm_prompt_tokens", "Prompt tokens per LLM call", SIZE_BUCKETS)
+LLM_RESPONSE_TOKENS = REGISTRY.histogram("support_llm_response_tokens", "Response tokens per LLM call", SIZE_BUCKETS)
+PROMPT_TOKENS_SAVED = REGISTRY.counter("support_prompt_tokens_saved_total", "Prompt tokens saved by compaction")
+LLM_CACHE_LOOKUPS = REGISTRY.counter("support_llm_cache_lookups_total", "LLM response cache lookups by result")
+LLM_QUEUE_WAIT = REGISTRY.histogram("support_llm_queue_wait_seconds", "Wait for a rate or concurrency slot")
+LLM_RETRY_ATTEMPTS = REGISTRY.counter("support_llm_retries_total", "LLM call retries by reason")
+LLM_HEDGES = REGISTRY.counter("support_llm_hedged_requests_total", "Hedged LLM requests by outcome")
+DRAFT_ABORTS = REGISTRY.counter("support_draft_aborts_total", "Streamed drafts stopped early by a local check")
+RETRIES = REGISTRY.counter("support_draft_retries_total", "Drafts regenerated after a rejected review")
+CLASSIFY_BATCH_SIZE = REGISTRY.histogram(
+    "support_classify_batch_size", "Tickets per batched classify call", BATCH_BUCKETS
+)
+CLASSIFY_BATCH_FILL = REGISTRY.histogram(
+    "support_classify_batch_fill_ratio", "Batch size / max batch size", RATIO_BUCKETS
+)
+CLASSIFY_QUEUE_DELAY = REGISTRY.histogram(
+    "support_classify_queue_delay_seconds", "Wait for a classify batch to be sent"
+)
+KB_RELOADS = REGISTRY.counter("support_kb_reloads_total", "Knowledge base hot reloads by result")
+KB_DOC_CHANGES = REGISTRY.counter("support_kb_doc_changes_total", "Documents added, changed or removed by reloads")
+CLASSIFICATIONS = REGISTRY.counter("support_classifications_total", "Classifications by path (rules, model, llm)")
+TICKETS = REGISTRY.counter("support_tickets_total", "Completed tickets by outcome")
+TICKET_LATENCY = REGISTRY.histogram("support_ticket_duration_seconds", "End-to-end ticket time by draft mode")
+REVIEWS = REGISTRY.counter("support_reviews_total", "LLM review verdicts by draft mode")
+SELF_REVIEWS = REGISTRY.counter("support_self_reviews_total", "Combined-mode drafts by self-review result")
+
+
+def enable(flag=True):
+    REGISTRY.enabled = flag
+
+
+def enabled():
+    return REGISTRY.enabled
+
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token) when the provider reports none"""
+    return max(1, len(text) // 4) if text else 0
+
+
+def instrument_node(name, fn):
+    """Wrap a graph node so its wall time and failures are recorded.
+
+    When metrics are disabled the wrapper only pays a single flag check.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not REGISTRY.enabled:
+            return fn(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            NODE_ERRORS.inc(node=name)
+            raise
+        finally:
+            NODE_LATENCY.observe(time.perf_counter() - started, node=name)
+    return wrapper
+
+
+def summary():
+    """Headline numbers for end-of-batch reporting"""
+    approved = TICKETS.value(outcome="approved")
+    escalated = TICKETS.value(outcome="escalated")
+    total = approved + escalated
+    paths = {item["labels"]["path"]: item["value"] for item in CLASSIFICATIONS.to_dict()}
+    classified = sum(paths.values())
+    return {
+        "tickets": total,
+        "fast_path_share": round((classified - paths.get("llm", 0)) / classified, 4) if classified else 0.0,
+        "escalation_rate": round(escalated / total, 4) if total else 0.0,
+        "retries": sum(item["value"] for item in RETRIES.to_dict()),
+        "draft_modes": draft_mode_summary(),
+        "classify_batches": classify_batch_summary(),
+        "nodes": {
+            item["labels"]["node"]: {"count": item["count"], "mean_seconds": item["mean"]}
+            for item in NODE_LATENCY.to_dict()
+        },
+    }
+
+def draft_mode_summary():
+    """Latency, approval and review pass rates per draft mode (separate vs combined)"""
+    modes = {}
+    for item in TICKET_LATENCY.to_dict():
+        mode = modes.setdefault(item["labels"]["mode"], {"tickets": 0, "approved": 0, "seconds": 0.0})
+        mode["tickets"] += item["count"]
+        mode["seconds"] += item["sum"]
+        if item["labels"]["outcome"] == "approved":
+            mode["approved"] += item["count"]
+    for item in REVIEWS.to_dict():
+        mode = modes.setdefault(item["labels"]["mode"], {"tickets": 0, "approved": 0, "seconds": 0.0})
+        mode.setdefault("reviews", {})[item["labels"]["status"]] = item["value"]
+    self_reviews = {item["labels"]["result"]: item["value"] for item in SELF_REVIEWS.to_dict()}
+
+    summary = {}
+    for name, mode in modes.items():
+        reviews = mode.get("reviews", {})
+        reviewed = sum(reviews.values())
+        summary[name] = {
+            "tickets": mode["tickets"],
+            "approval_rate": round(mode["approved"] / mode["tickets"], 4) if mode["tickets"] else 0.0,
+            "mean_ticket_seconds": round(mode["seconds"] / mode["tickets"], 4) if mode["tickets"] else 0.0,
+            "review_pass_rate": round(reviews.get("approved", 0) / reviewed, 4) if reviewed else None,
+        }
+    if "combined" in summary:
+        summary["combined"]["self_approved"] = self_reviews.get("self_approved", 0)
+        summary["combined"]["sent_to_review"] = self_reviews.get("sent_to_review", 0)
+    return summary
+
+
+def classify_batch_summary():
+    """Batch count, mean size and fill, and mean queue delay of batched classification"""
+    sizes, fills, delays = (
+        metric.to_dict() for metric in (CLASSIFY_BATCH_SIZE, CLASSIFY_BATCH_FILL, CLASSIFY_QUEUE_DELAY)
+    )
+    if not sizes:
+        return {}
+    return {
+        "batches": sizes[0]["count"],
+        "mean_size": round(sizes[0]["mean"], 2),
+        "mean_fill": round(fills[0]["mean"], 4) if fills else 0.0,
+        "mean_queue_delay_ms": round(delays[0]["mean"] * 1000, 2) if delays else 0.0,
+    }
+
+# ------------------------------------------------
+# /metrics HTTP endpoint
+# ------------------------------------------------
+def start_metrics_server(port=9100, host="127.0.0.1"):
+    """Serve the registry in Prometheus text format on a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logger.debug(f"metrics endpoint: {format % args}")
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
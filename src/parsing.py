@@ -0,0 +1,206 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ("Billing", "Technical", "Security", "General")
+DEFAULT_CATEGORY = "General"
+REVIEW_STATUSES = ("approved", "rejected")
+
+# JSON schemas sent to the model in structured-output mode
+CATEGORY_SCHEMA = {
+    "type": "object",
+    "properties": {"category": {"type": "string", "enum": list(CATEGORIES)}},
+    "required": ["category"],
+}
+REVIEW_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "status": {"type": "string", "enum": list(REVIEW_STATUSES)},
+        "feedback": {"type": "string"},
+    },
+    "required": ["status", "feedback"],
+}
+BATCH_CATEGORY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "categories": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer"},
+                    "category": {"type": "string", "enum": list(CATEGORIES)},
+                },
+                "required": ["index", "category"],
+            },
+        },
+    },
+    "required": ["categories"],
+}
+COMPOSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "draft": {"type": "string"},
+        "self_score": {"type": "number"},
+        "issues": {"type": "string"},
+    },
+    "required": ["draft", "self_score", "issues"],
+}
+
+_CATEGORY_PATTERN = re.compile(r"\b(" + "|".join(CATEGORIES) + r")\b", re.IGNORECASE)
+_BOLD_CATEGORY_PATTERN = re.compile(r"\*\*\s*(" + "|".join(CATEGORIES) + r")\s*\*\*", re.IGNORECASE)
+_LABELED_CATEGORY_PATTERN = re.compile(
+    r"category\s*(?:is|:|=)\s*[\"'*`]*\s*(" + "|".join(CATEGORIES) + r")\b", re.IGNORECASE
+)
+_LEADING_STATUS_PATTERN = re.compile(r"^\W*(approved|rejected)\b", re.IGNORECASE)
+_LABELED_STATUS_PATTERN = re.compile(
+    r"\b(?:status|verdict|decision)\s*(?:is|:|=)\s*[\"'*`]*\s*(approved|rejected)\b", re.IGNORECASE
+)
+
+
+def _load_json_object(text):
+    """Parse a JSON object, tolerating ```json fences and surrounding prose"""
+    cleaned = re.sub(r"^```(?:json)?\s*|\s*```$", "", text.strip())
+    try:
+        data = json.loads(cleaned)
+    except json.JSONDecodeError:
+        match = re.search(r"\{.*\}", cleaned, re.DOTALL)
+        if not match:
+            return None
+        try:
+            data = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+    return data if isinstance(data, dict) else None
+
+
+def normalize_category(value):
+    """Map a free-form label onto one of CATEGORIES, or None"""
+    if not isinstance(value, str):
+        return None
+    value = value.strip().strip("*`'\".: ").lower()
+    for category in CATEGORIES:
+        if value == category.lower():
+            return category
+    return None
+
+# ------------------------------------------------
+# Classifier output
+# ------------------------------------------------
+def parse_category(text):
+    """Extract a valid category from a classifier response.
+
+    Tries, in order: a JSON object with a valid "category", a bare label,
+    a label stated as "category is X" or in bold, and finally the only
+    category named anywhere in the text. Falls back to DEFAULT_CATEGORY.
+    """
+    data = _load_json_object(text)
+    if data is not None:
+        category = normalize_category(data.get("category"))
+        if category:
+            return category
+
+    category = normalize_category(text.split("\n")[0])
+    if category:
+        return category
+
+    for pattern in (_LABELED_CATEGORY_PATTERN, _BOLD_CATEGORY_PATTERN):
+        match = pattern.search(text)
+        if match:
+            return normalize_category(match.group(1))
+
+    mentioned = {normalize_category(match) for match in _CATEGORY_PATTERN.findall(text)}
+    if len(mentioned) == 1:
+        return mentioned.pop()
+
+    logger.warning(f"Could not parse a category from classifier output, using {DEFAULT_CATEGORY}: {text[:100]!r}")
+    return DEFAULT_CATEGORY
+
+_NUMBERED_CATEGORY_PATTERN = re.compile(
+    r"^\W*(?:ticket\s*)?(\d+)\W+(" + "|".join(CATEGORIES) + r")\b", re.IGNORECASE | re.MULTILINE
+)
+
+
+def parse_categories(text, count):
+    """Categories for a multi-ticket classification, one per ticket (None where missing).
+
+    Reads {"categories": [{"index", "category"}]} (indexes are 1-based) or
+    numbered lines such as "1. Billing". Missing or invalid entries are None
+    so the caller can classify those tickets on their own.
+    """
+    results = [None] * count
+    data = _load_json_object(text)
+    entries = data.get("categories") if data is not None else None
+    if isinstance(entries, list):
+        for position, entry in enumerate(entries, start=1):
+            if isinstance(entry, dict):
+                index, category = entry.get("index", position), entry.get("category")
+            else:
+                index, category = position, entry
+            try:
+                index = int(index)
+            except (TypeError, ValueError):
+                continue
+            if 1 <= index <= count and results[index - 1] is None:
+                results[index - 1] = normalize_category(category)
+        return results
+
+    for index, category in _NUMBERED_CATEGORY_PATTERN.findall(text):
+        index = int(index)
+        if 1 <= index <= count and results[index - 1] is None:
+            results[index - 1] = normalize_category(category)
+    return results
+
+# ------------------------------------------------
+# Reviewer output
+# ------------------------------------------------
+def parse_review(text):
+    """Return (status, feedback) from a reviewer response.
+
+    JSON with a valid "status" wins. Otherwise a leading "approved"/"rejected"
+    decides, then a labelled one ("Status: approved", "verdict is rejected").
+    Anything else, e.g. "needs changes before it can be approved", is
+    treated as rejected.
+    """
+    data = _load_json_object(text)
+    if data is not None:
+        status = str(data.get("status", "")).strip().lower()
+        if status in REVIEW_STATUSES:
+            return status, str(data.get("feedback", "")).strip()
+
+    feedback = text.strip()
+    match = _LEADING_STATUS_PATTERN.match(feedback)
+    if match:
+        return match.group(1).lower(), feedback
+
+    match = _LABELED_STATUS_PATTERN.search(feedback)
+    if match:
+        return match.group(1).lower(), feedback
+    return "rejected", feedback
+
+# ------------------------------------------------
+# Combined draft + self-review output
+# ------------------------------------------------
+def parse_composed(text):
+    """Return (draft, self_score, issues) from a combined draft/self-review call.
+
+    The score is clamped to 0..1 (scores given out of 5, 10 or 100 are
+    rescaled). Without valid JSON the whole reply is the draft and the score
+    is 0, so it always goes to the separate reviewer.
+    """
+    data = _load_json_object(text)
+    if data is None or not str(data.get("draft", "")).strip():
+        logger.warning(f"Could not parse a combined draft response, sending it to review: {text[:100]!r}")
+        return text.strip(), 0.0, "Self-review missing or unparseable."
+
+    try:
+        score = float(data.get("self_score", 0))
+    except (TypeError, ValueError):
+        score = 0.0
+    for scale in (5, 10, 100):
+        if 1 < score <= scale:
+            score /= scale
+            break
+    return str(data["draft"]).strip(), min(1.0, max(0.0, score)), str(data.get("issues", "")).strip()
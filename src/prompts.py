@@ -0,0 +1,220 @@
+import logging
+import os
+import re
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------
+# Prompt budgets
+# ------------------------------------------------
+# Rough token budgets per node (metrics.estimate_tokens); 0 disables trimming
+DEFAULT_BUDGETS = {"draft": 1200, "review": 1600}
+MAX_FEEDBACK_SENTENCES = 3
+
+
+def get_budget(node, config=None):
+    """configurable["prompt_budgets"][node], then $PROMPT_BUDGET_<NODE>, then the default"""
+    budgets = (config or {}).get("configurable", {}).get("prompt_budgets") or {}
+    if node in budgets:
+        return int(budgets[node])
+    return int(os.getenv(f"PROMPT_BUDGET_{node.upper()}", DEFAULT_BUDGETS.get(node, 0)))
+
+# ------------------------------------------------
+# Compaction helpers
+# ------------------------------------------------
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+ACTIONABLE_PATTERN = re.compile(
+    r"\b(?:add|include|remove|mention|clarify|explain|provide|specify|avoid|replace|rephrase|shorten|"
+    r"expand|should|must|needs?|missing|lacks?|instead|don't|do not|incorrect|inaccurate|wrong|unclear)\b",
+    re.IGNORECASE
+)
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.split(text or "") if sentence.strip()]
+
+
+def _normalized(sentence):
+    return " ".join(sentence.lower().split())
+
+
+def dedupe_docs(docs):
+    """Drop sentences already seen in a higher-ranked doc, and docs left empty"""
+    seen = set()
+    compacted = []
+    for doc in docs:
+        kept = []
+        for sentence in split_sentences(doc):
+            key = _normalized(sentence)
+            if key not in seen:
+                seen.add(key)
+                kept.append(sentence)
+        if kept:
+            compacted.append(" ".join(kept))
+    return compacted
+
+
+def actionable_feedback(feedback, limit=MAX_FEEDBACK_SENTENCES):
+    """Keep the reviewer sentences that ask for a change; praise and filler go"""
+    sentences = split_sentences(feedback)
+    actionable = [sentence for sentence in sentences if ACTIONABLE_PATTERN.search(sentence)]
+    return " ".join((actionable or sentences[:1])[:limit])
+
+
+def truncate_tokens(text, tokens):
+    """Cut `text` to about `tokens` tokens at a word boundary"""
+    limit = tokens * 4
+    if len(text) <= limit:
+        return text
+    # Leave room for the " ..." marker
+    return text[:max(0, limit - 4)].rsplit(" ", 1)[0].rstrip(" ,;") + " ..."
+
+# ------------------------------------------------
+# Classification
+# ------------------------------------------------
+def build_classify_prompt(ticket, categories):
+    return (
+        f"Classify the following support ticket into one of these categories: "
+        f"{', '.join(categories)}.\n"
+        f"Respond with JSON only, in the form {{\"category\": \"<one of the categories>\"}}.\n"
+        f"Subject: {ticket.get('subject', '')}\n"
+        f"Description: {ticket.get('description', '')}\n"
+        f"Category:"
+    )
+
+
+def build_batch_classify_prompt(tickets, categories):
+    """One prompt classifying several tickets; answers are matched back by index"""
+    lines = [
+        f"Classify each of the following {len(tickets)} support tickets into one of these categories: "
+        f"{', '.join(categories)}.",
+        "Respond with JSON only, in the form "
+        "{\"categories\": [{\"index\": <ticket number>, \"category\": \"<one of the categories>\"}, ...]}, "
+        "with exactly one entry per ticket.",
+    ]
+    for index, ticket in enumerate(tickets, start=1):
+        lines += ["", f"Ticket {index}:", f"Subject: {ticket.get('subject', '')}",
+                  f"Description: {ticket.get('description', '')}"]
+    return "\n".join(lines + ["", "Categories:"])
+
+# ------------------------------------------------
+# Layout
+# ------------------------------------------------
+# Sections go from most to least stable: the node's fixed instructions, then
+# what is shared by every attempt of a ticket (category, docs, ticket text),
+# then what changes per attempt. Retries of the same node for one ticket
+# therefore share a long identical prefix the provider can cache. Draft and
+# review prompts open with different instructions (and have their own
+# budgets), so they only share a prefix with their own node's prompts.
+DRAFT_INSTRUCTIONS = (
+    "You are a professional support agent. Read the support ticket below and the relevant information provided. "
+    "Draft a clear, empathetic, and actionable response for the customer. "
+    "Directly address the user's issue, reference the relevant info, and provide step-by-step guidance or next actions. "
+    "If the issue is security-related, advise on immediate steps to protect the account. "
+    "If billing, explain refund/dispute process. "
+    "If technical, offer troubleshooting steps. "
+    "If general, answer the inquiry clearly. "
+    "Do not make promises you cannot keep."
+)
+
+REVIEW_INSTRUCTIONS = (
+    "You are a support QA reviewer. Read the support ticket, relevant info, and the draft response below. "
+    "Evaluate if the response is accurate, helpful, and compliant with support guidelines. "
+    "Respond with JSON only, in the form {\"status\": \"approved\" or \"rejected\", \"feedback\": \"...\"}. "
+    "If approved, give a short comment as feedback. If rejected, give specific feedback for revision."
+)
+
+COMPOSE_INSTRUCTIONS = DRAFT_INSTRUCTIONS + (
+    " Then give the draft a Self-Assessment: judge it as strictly as a QA check would for accuracy, helpfulness "
+    "and compliance with support guidelines. "
+    "Respond with JSON only, in the form {\"draft\": \"...\", \"self_score\": <number from 0 to 1>, "
+    "\"issues\": \"...\"}, where self_score is how confident you are that the draft would be approved "
+    "and issues lists anything a reviewer would flag."
+)
+
+
+def _layout(instructions, category, docs, subject, description, variable):
+    lines = [instructions, f"Category: {category}", f"Relevant Info: {'; '.join(docs)}"]
+    lines += [f"Subject: {subject}", f"Description: {description}"]
+    return "\n".join(lines + variable)
+
+
+def _fit(instructions, category, docs, subject, description, variable, budget):
+    """Drop the lowest-ranked docs, then shorten the last doc and the
+    description, until the prompt fits `budget` tokens"""
+    docs = list(docs)
+
+    def render():
+        return _layout(instructions, category, docs, subject, description, variable)
+
+    prompt = render()
+    if not budget:
+        return prompt
+    while len(docs) > 1 and metrics.estimate_tokens(prompt) > budget:
+        docs.pop()
+        prompt = render()
+    over = metrics.estimate_tokens(prompt) - budget
+    if over > 0 and docs:
+        docs[-1] = truncate_tokens(docs[-1], max(0, metrics.estimate_tokens(docs[-1]) - over))
+        prompt = render()
+    over = metrics.estimate_tokens(prompt) - budget
+    if over > 0:
+        description = truncate_tokens(description, max(0, metrics.estimate_tokens(description) - over))
+        prompt = render()
+    return prompt
+
+
+def _report(node, ticket, prompt, naive):
+    tokens = metrics.estimate_tokens(prompt)
+    saved = max(0, metrics.estimate_tokens(naive) - tokens)
+    if saved:
+        logger.info(f"{node} prompt for '{ticket.get('subject', '')}': {tokens} tokens ({saved} saved by compaction)")
+        if metrics.enabled():
+            metrics.PROMPT_TOKENS_SAVED.inc(saved, node=node)
+    return saved
+
+
+def build_draft_prompt(ticket, category, docs, feedback, attempt, config=None):
+    """Draft prompt within the "draft" budget; returns (prompt, tokens saved)"""
+    subject, description = ticket.get("subject", ""), ticket.get("description", "")
+    tail = [f"Attempt: {attempt}", "", "Customer Response:"]
+    variable = [f"Previous Reviewer Feedback: {actionable_feedback(feedback)}"] if feedback else []
+    prompt = _fit(
+        DRAFT_INSTRUCTIONS, category, dedupe_docs(docs), subject, description,
+        variable + tail, get_budget("draft", config)
+    )
+    naive = _layout(
+        DRAFT_INSTRUCTIONS, category, docs, subject, description,
+        [f"Previous Reviewer Feedback: {feedback}"] + tail
+    )
+    return prompt, _report("draft", ticket, prompt, naive)
+
+
+def build_review_prompt(ticket, category, docs, draft, attempt, config=None):
+    """Review prompt within the "review" budget; the draft itself is never cut"""
+    subject, description = ticket.get("subject", ""), ticket.get("description", "")
+    variable = [f"Draft Response: {draft}", f"Attempt: {attempt}", "", "Review Result:"]
+    prompt = _fit(
+        REVIEW_INSTRUCTIONS, category, dedupe_docs(docs), subject, description,
+        variable, get_budget("review", config)
+    )
+    naive = _layout(REVIEW_INSTRUCTIONS, category, docs, subject, description, variable)
+    return prompt, _report("review", ticket, prompt, naive)
+
+
+def build_compose_prompt(ticket, category, docs, feedback, attempt, config=None):
+    """Combined draft + self-review prompt, sharing the "draft" budget"""
+    subject, description = ticket.get("subject", ""), ticket.get("description", "")
+    tail = [f"Attempt: {attempt}", "", "JSON Result:"]
+    variable = [f"Previous Reviewer Feedback: {actionable_feedback(feedback)}"] if feedback else []
+    prompt = _fit(
+        COMPOSE_INSTRUCTIONS, category, dedupe_docs(docs), subject, description,
+        variable + tail, get_budget("draft", config)
+    )
+    naive = _layout(
+        COMPOSE_INSTRUCTIONS, category, docs, subject, description,
+        [f"Previous Reviewer Feedback: {feedback}"] + tail
+    )
+    return prompt, _report("compose", ticket, prompt, naive)
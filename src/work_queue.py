@@ -0,0 +1,222 @@
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLostError(RuntimeError):
+    """The job's lease expired and another worker may now hold it"""
+
+# ------------------------------------------------
+# Durable local work queue (SQLite)
+# ------------------------------------------------
+class WorkQueue:
+    """Ticket queue shared by worker processes through one SQLite file.
+
+    A worker leases a job for `visibility_timeout` seconds and renews the
+    lease while it works (keep_leased). If it neither acks nor fails the job
+    in time (e.g. the process crashed) the job becomes visible again. Failed
+    jobs are retried with jittered exponential backoff and marked "dead"
+    after `max_attempts`, including jobs whose worker died on the last one.
+    """
+
+    def __init__(self, path, visibility_timeout=300.0, max_attempts=5, backoff_base=2.0, backoff_max=300.0):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._db = self._connect()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY,"
+            " ticket TEXT NOT NULL,"
+            " status TEXT NOT NULL DEFAULT 'pending',"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " available_at REAL NOT NULL,"
+            " lease_expires REAL,"
+            " leased_by TEXT,"
+            " last_error TEXT,"
+            " result TEXT,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, available_at)")
+
+    def _connect(self):
+        # Autocommit mode; write transactions are opened explicitly below
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def close(self):
+        self._db.close()
+
+    def enqueue_many(self, tickets):
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            cursor = self._db.executemany(
+                "INSERT INTO jobs (ticket, available_at, updated_at) VALUES (?, ?, ?)",
+                ((json.dumps(ticket, ensure_ascii=False), now, now) for ticket in tickets)
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return cursor.rowcount
+
+    def enqueue(self, ticket):
+        return self.enqueue_many([ticket])
+
+    def lease(self, worker_id, on_dead=None):
+        """Claim the next visible job; returns (job_id, ticket, attempt) or None.
+
+        Jobs whose lease expired on their last allowed attempt (the worker
+        crashed or hung) are marked dead instead, in the same transaction,
+        and passed to on_dead(ticket, attempts, error) once it commits.
+        """
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            expired = self._db.execute(
+                "SELECT id, ticket, attempts FROM jobs"
+                " WHERE status = 'leased' AND lease_expires <= ? AND attempts >= ?",
+                (now, self.max_attempts)
+            ).fetchall()
+            dead = []
+            for job_id, ticket, attempts in expired:
+                error = f"Lease expired on attempt {attempts} (worker crashed or timed out)"
+                self._db.execute(
+                    "UPDATE jobs SET status = 'dead', lease_expires = NULL, last_error = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (error, now, job_id)
+                )
+                dead.append((json.loads(ticket), attempts, error))
+
+            row = self._db.execute(
+                "SELECT id, ticket, attempts FROM jobs"
+                " WHERE (status = 'pending' AND available_at <= ?)"
+                "    OR (status = 'leased' AND lease_expires <= ?)"
+                " ORDER BY available_at, id LIMIT 1",
+                (now, now)
+            ).fetchone()
+            if row is not None:
+                job_id, ticket, attempts = row
+                self._db.execute(
+                    "UPDATE jobs SET status = 'leased', attempts = ?, lease_expires = ?, leased_by = ?, updated_at = ?"
+                    " WHERE id = ?",
+                    (attempts + 1, now + self.visibility_timeout, worker_id, now, job_id)
+                )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+
+        for ticket, attempts, error in dead:
+            logger.warning(f"Ticket {ticket.get('id')} dead-lettered: {error}")
+            if on_dead is not None:
+                on_dead(ticket, attempts, error)
+        if row is None:
+            return None
+        return job_id, json.loads(ticket), attempts + 1
+
+    @staticmethod
+    def _extend(db, job_id, worker_id, seconds):
+        now = time.time()
+        cursor = db.execute(
+            "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND status = 'leased' AND leased_by = ?",
+            (now + seconds, now, job_id, worker_id)
+        )
+        return cursor.rowcount == 1
+
+    def extend(self, job_id, worker_id):
+        """Push the lease out by another visibility timeout; False if `worker_id` lost it"""
+        return self._extend(self._db, job_id, worker_id, self.visibility_timeout)
+
+    @contextmanager
+    def keep_leased(self, job_id, worker_id, interval=None):
+        """Renew the lease every `interval` seconds (default: a third of the
+        visibility timeout) while the block runs, so slow tickets are not
+        handed to a second worker"""
+        interval = interval or self.visibility_timeout / 3
+        stop = threading.Event()
+
+        def renew():
+            # SQLite connections belong to one thread, so the heartbeat has its own
+            db = self._connect()
+            try:
+                while not stop.wait(interval):
+                    if not self._extend(db, job_id, worker_id, self.visibility_timeout):
+                        logger.warning(f"[{worker_id}] Lost the lease on job {job_id}")
+                        break
+            except sqlite3.Error as e:
+                logger.warning(f"[{worker_id}] Could not renew the lease on job {job_id}: {e}")
+            finally:
+                db.close()
+
+        thread = threading.Thread(target=renew, name=f"lease-{job_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def ack(self, job_id, worker_id, result):
+        """Mark a job done; raises LeaseLostError if `worker_id` no longer holds it"""
+        cursor = self._db.execute(
+            "UPDATE jobs SET status = 'done', result = ?, lease_expires = NULL, updated_at = ?"
+            " WHERE id = ? AND status = 'leased' AND leased_by = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), job_id, worker_id)
+        )
+        if cursor.rowcount != 1:
+            raise LeaseLostError(f"Job {job_id} is no longer leased by {worker_id}")
+
+    def backoff(self, attempt):
+        delay = min(self.backoff_max, self.backoff_base ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    def fail(self, job_id, worker_id, error):
+        """Schedule a retry, or dead-letter the job; returns True if it is now dead.
+
+        Raises LeaseLostError if `worker_id` no longer holds the lease.
+        """
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute(
+                "SELECT attempts FROM jobs WHERE id = ? AND status = 'leased' AND leased_by = ?",
+                (job_id, worker_id)
+            ).fetchone()
+            if row is None:
+                raise LeaseLostError(f"Job {job_id} is no longer leased by {worker_id}")
+            (attempts,) = row
+            dead = attempts >= self.max_attempts
+            self._db.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_expires = NULL, last_error = ?, updated_at = ?"
+                " WHERE id = ?",
+                ("dead" if dead else "pending", now + (0 if dead else self.backoff(attempts)), error, now, job_id)
+            )
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        return dead
+
+    def stats(self):
+        counts = dict(self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {status: counts.get(status, 0) for status in ("pending", "leased", "done", "dead")}
+
+    def outstanding(self):
+        stats = self.stats()
+        return stats["pending"] + stats["leased"]
+
+    def iter_results(self):
+        """Finished jobs in completion order"""
+        for (result,) in self._db.execute("SELECT result FROM jobs WHERE status = 'done' ORDER BY updated_at, id"):
+            yield json.loads(result)
@@ -0,0 +1,172 @@
+import glob
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from work_queue import LeaseLostError, WorkQueue
+
+logger = logging.getLogger(__name__)
+
+# ------------------------------------------------
+# Worker process
+# ------------------------------------------------
+def dead_letter(ticket, attempts, error):
+    """Hand a ticket that kept failing to humans through the escalation sink"""
+    from escalation import get_escalation_writer, escalation_row
+
+    get_escalation_writer().submit(escalation_row(
+        ticket,
+        category="",
+        attempts=attempts,
+        draft="",
+        feedback=f"Processing failed after {attempts} attempt(s): {error}",
+        docs=[]
+    ))
+
+
+def worker_loop(queue_path, worker_id, config=None, stop=None, drain=True,
+                poll_interval=0.5, queue_options=None, initializer=None, initargs=(), metrics_dir=None):
+    """Lease, process and ack tickets until the queue is drained or `stop` is set.
+
+    With `metrics_dir`, metrics are recorded and dumped there as JSON when
+    the worker exits, for run_pool to aggregate.
+    """
+    # Results go through the queue; keep the node progress prints off the
+    # stdout the parent may be exporting results to
+    sys.stdout = sys.stderr
+    if initializer is not None:
+        initializer(*initargs)
+    # Several processes appending to one CSV would interleave rows and race on
+    # rotation; SQLite serializes their writes
+    os.environ.setdefault("ESCALATION_SINK", "sqlite")
+    if os.environ["ESCALATION_SINK"].strip().lower() == "csv":
+        logger.warning(f"[{worker_id}] ESCALATION_SINK=csv is not safe with several workers; prefer sqlite")
+
+    from batch import summarize_result
+    import main as agent
+    import metrics
+
+    if metrics_dir:
+        metrics.enable()
+
+    work_queue = WorkQueue(queue_path, **(queue_options or {}))
+    # Worker names repeat across pools, so leases are held by name and pid
+    holder = f"{worker_id}:{os.getpid()}"
+    processed = failed = 0
+    try:
+        while stop is None or not stop.is_set():
+            job = work_queue.lease(holder, on_dead=dead_letter)
+            if job is None:
+                # Jobs still backing off or leased elsewhere keep the worker around
+                if drain and work_queue.outstanding() == 0:
+                    break
+                if stop is not None:
+                    stop.wait(poll_interval)
+                else:
+                    time.sleep(poll_interval)
+                continue
+
+            job_id, ticket, attempt = job
+            started = time.perf_counter()
+            try:
+                with work_queue.keep_leased(job_id, holder):
+                    result = agent.process_ticket(ticket, config=config)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                logger.error(f"[{worker_id}] Ticket {ticket.get('id')} failed on attempt {attempt}: {error}")
+                failed += 1
+                try:
+                    dead = work_queue.fail(job_id, holder, error)
+                except LeaseLostError as lost:
+                    logger.warning(f"[{worker_id}] {lost}; leaving the job to its new holder")
+                    continue
+                if dead:
+                    logger.warning(f"[{worker_id}] Ticket {ticket.get('id')} dead-lettered after {attempt} attempt(s)")
+                    dead_letter(ticket, attempt, error)
+                continue
+            try:
+                work_queue.ack(job_id, holder, summarize_result(ticket, result, time.perf_counter() - started))
+            except LeaseLostError as lost:
+                logger.warning(f"[{worker_id}] {lost}; discarding this result")
+                continue
+            processed += 1
+    finally:
+        agent.close_escalation_writer()
+        work_queue.close()
+        if metrics_dir:
+            metrics.REGISTRY.dump_json(os.path.join(metrics_dir, f"{worker_id}-{os.getpid()}.json"))
+    logger.info(f"[{worker_id}] Worker finished: {processed} processed, {failed} failed")
+
+# ------------------------------------------------
+# Pool
+# ------------------------------------------------
+def collect_metrics(metrics_dir):
+    """Merge the workers' metric dumps into this process's registry"""
+    import metrics
+
+    for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+        with open(path, "r", encoding="utf-8") as file:
+            metrics.REGISTRY.merge(json.load(file))
+
+
+def run_pool(queue_path, workers=None, config=None, drain=True, poll_interval=0.5,
+             queue_options=None, initializer=None, initargs=(), collect_worker_metrics=False):
+    """Run `workers` processes (default: CPU count) against one queue file.
+
+    Processes are started with the "spawn" method so none of them inherits
+    the parent's threads or open SQLite handles. `initializer(*initargs)`
+    runs first in every worker, e.g. to set up logging or a model factory;
+    it must be importable (picklable by reference). With
+    `collect_worker_metrics`, the workers record metrics and their totals are
+    merged into this process's registry when they exit. Escalations default
+    to the SQLite sink in workers. Returns the queue stats once all workers
+    have exited.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Create the schema once up front rather than racing on it in every worker
+    WorkQueue(queue_path, **(queue_options or {})).close()
+
+    metrics_dir = tempfile.mkdtemp(prefix="worker-metrics-") if collect_worker_metrics else None
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    processes = [
+        context.Process(
+            target=worker_loop,
+            name=f"worker-{index}",
+            args=(queue_path, f"worker-{index}", config, stop, drain, poll_interval,
+                  queue_options, initializer, initargs, metrics_dir)
+        )
+        for index in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    logger.info(f"Started {workers} worker process(es) on {queue_path}")
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Leased jobs become visible again after their timeout
+        logger.info("Stopping workers...")
+        stop.set()
+        for process in processes:
+            process.join()
+    for process in processes:
+        if process.exitcode:
+            logger.warning(f"{process.name} exited with code {process.exitcode}")
+    if metrics_dir:
+        # A worker that crashed has no dump, so its metrics are missing
+        collect_metrics(metrics_dir)
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+    work_queue = WorkQueue(queue_path, **(queue_options or {}))
+    try:
+        return work_queue.stats()
+    finally:
+        work_queue.close()